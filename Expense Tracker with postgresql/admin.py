@@ -0,0 +1,308 @@
+import argparse
+import threading
+import time
+from tabulate import tabulate
+from colorama import init, Fore, Style
+import psycopg2
+from database import DatabaseManager
+from utils import format_currency
+
+SUMMARY_VIEWS = ("user_summary", "symbol_summary")
+# Advisory lock name, hashed with hashtext() into the key so only one refresher runs at a time
+REFRESH_LOCK_NAME = "summary_refresh"
+USER_SORT_COLUMNS = {
+    "balance": "balance",
+    "income": "total_income",
+    "expense": "total_expense",
+    "invested": "invested_value",
+    "holdings": "holdings_count",
+}
+
+
+def setup_summaries(conn):
+    """Create the summary materialized views and their refresh log if missing.
+
+    Kept out of DatabaseManager.setup_database so starting the app never builds the views;
+    the first admin run does.
+    """
+    cursor = conn.cursor()
+    try:
+        # summary_refreshes records when each view's data was last computed
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS summary_refreshes (
+                view_name VARCHAR(63) PRIMARY KEY,
+                refreshed_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+        """)
+        cursor.execute("SELECT to_regclass('user_summary') IS NULL, to_regclass('symbol_summary') IS NULL")
+        new_views = [view for view, missing in zip(SUMMARY_VIEWS, cursor.fetchone()) if missing]
+
+        cursor.execute("""
+            CREATE MATERIALIZED VIEW IF NOT EXISTS user_summary AS
+            SELECT
+                u.id AS user_id,
+                u.username,
+                u.full_name,
+                COALESCE(u.initial_balance, 0) AS initial_balance,
+                COALESCE(e.total_income, 0) AS total_income,
+                COALESCE(e.total_expense, 0) AS total_expense,
+                COALESCE(u.initial_balance, 0) + COALESCE(e.total_income, 0) - COALESCE(e.total_expense, 0) AS balance,
+                COALESCE(e.transaction_count, 0) AS transaction_count,
+                COALESCE(p.invested_value, 0) AS invested_value,
+                COALESCE(p.holdings_count, 0) AS holdings_count,
+                COALESCE(t.trade_count, 0) AS trade_count
+            FROM users u
+            LEFT JOIN (
+                SELECT user_id,
+                       SUM(CASE WHEN type='income' THEN amount ELSE 0 END) AS total_income,
+                       SUM(CASE WHEN type='expense' THEN amount ELSE 0 END) AS total_expense,
+                       COUNT(*) AS transaction_count
+                FROM expenses GROUP BY user_id
+            ) e ON e.user_id = u.id
+            LEFT JOIN (
+                SELECT user_id, SUM(quantity * avg_buy_price) AS invested_value, COUNT(DISTINCT stock_symbol) AS holdings_count
+                FROM portfolio GROUP BY user_id
+            ) p ON p.user_id = u.id
+            LEFT JOIN (
+                SELECT user_id, COUNT(*) AS trade_count FROM stock_transactions GROUP BY user_id
+            ) t ON t.user_id = u.id
+        """)
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_user_summary_user_id ON user_summary (user_id)")
+
+        cursor.execute("""
+            CREATE MATERIALIZED VIEW IF NOT EXISTS symbol_summary AS
+            SELECT
+                stock_symbol,
+                COUNT(DISTINCT user_id) AS holders,
+                SUM(quantity) AS total_quantity,
+                SUM(quantity * avg_buy_price) AS invested_value
+            FROM portfolio
+            GROUP BY stock_symbol
+        """)
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_symbol_summary_symbol ON symbol_summary (stock_symbol)")
+        for view in new_views:  # Created with data just now
+            cursor.execute("""
+                INSERT INTO summary_refreshes (view_name) VALUES (%s)
+                ON CONFLICT (view_name) DO UPDATE SET refreshed_at = now()
+            """, (view,))
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def refresh_summaries(conn):
+    """Refresh the summary materialized views without blocking readers; return False if another refresh holds the lock."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", (REFRESH_LOCK_NAME,))
+        if not cursor.fetchone()[0]:
+            conn.rollback()
+            return False
+        for view in SUMMARY_VIEWS:
+            cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+            cursor.execute("""
+                INSERT INTO summary_refreshes (view_name) VALUES (%s)
+                ON CONFLICT (view_name) DO UPDATE SET refreshed_at = now()
+            """, (view,))
+        conn.commit()
+        return True
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+class SummaryRefresher(threading.Thread):
+    """Background worker that refreshes the summary views every `interval` seconds on its own connection."""
+
+    def __init__(self, connect, interval=300.0):
+        super().__init__(name="summary-refresher", daemon=True)
+        self.connect = connect
+        self.interval = interval
+        self.last_refresh = None
+        self.last_error = None
+        self._conn = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while True:
+            self.refresh()
+            if self._stop_event.wait(self.interval):
+                break
+
+    def refresh(self):
+        try:
+            if self._conn is None or self._conn.closed:
+                self._conn = self.connect()
+            started = time.monotonic()
+            if refresh_summaries(self._conn):
+                self.last_refresh = time.time()
+                self.last_error = None
+                return time.monotonic() - started
+        except psycopg2.Error as e:
+            self.last_error = str(e).strip()
+            if isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)) and self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        return None
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        if self._conn is not None:
+            self._conn.close()
+
+
+class AdminReports:
+    """Cross-user reports read from the summary materialized views."""
+
+    def __init__(self, db_conn):
+        self.conn = db_conn
+        self.cursor = db_conn.cursor()
+
+    def refreshed_at(self):
+        """Return when the oldest summary view was last refreshed, or None if unknown."""
+        self.cursor.execute(
+            "SELECT MIN(refreshed_at), COUNT(*) FROM summary_refreshes WHERE view_name = ANY(%s)",
+            (list(SUMMARY_VIEWS),)
+        )
+        refreshed_at, count = self.cursor.fetchone()
+        return refreshed_at if count == len(SUMMARY_VIEWS) else None
+
+    def overview(self):
+        """Display totals across all users."""
+        try:
+            refreshed_at = self.refreshed_at()
+            self.cursor.execute("""
+                SELECT COUNT(*), SUM(total_income), SUM(total_expense), SUM(balance),
+                       SUM(invested_value), SUM(holdings_count), SUM(transaction_count), SUM(trade_count)
+                FROM user_summary
+            """)
+            users, income, expense, balance, invested, holdings, transactions, trades = self.cursor.fetchone()
+            print("\n--- All Users Overview ---")
+            if refreshed_at:
+                print(f"Summary data as of {refreshed_at.strftime('%d-%m-%Y %H:%M:%S')}")
+            else:
+                print(f"{Fore.YELLOW}Summary refresh time unknown; run with --refresh for current data.{Style.RESET_ALL}")
+            print(tabulate([
+                ["Users", users],
+                ["Total Income", format_currency(float(income or 0))],
+                ["Total Expense", format_currency(float(expense or 0))],
+                ["Total Balance", format_currency(float(balance or 0))],
+                ["Invested Value (at cost)", format_currency(float(invested or 0))],
+                ["Holdings", int(holdings or 0)],
+                ["Transactions", int(transactions or 0)],
+                ["Stock Trades", int(trades or 0)],
+            ], tablefmt="pretty"))
+        except psycopg2.Error as e:
+            print(f"{Fore.RED}Error fetching overview: {e}{Style.RESET_ALL}")
+            self.conn.rollback()
+
+    def top_users(self, sort_by="balance", limit=10):
+        """Display the users with the highest value of a summary column."""
+        column = USER_SORT_COLUMNS[sort_by]
+        try:
+            self.cursor.execute(f"""
+                SELECT user_id, username, full_name, total_income, total_expense, balance, invested_value, holdings_count
+                FROM user_summary
+                ORDER BY {column} DESC, user_id
+                LIMIT %s
+            """, (limit,))
+            rows = self.cursor.fetchall()
+            if not rows:
+                print(f"{Fore.RED}No users found.{Style.RESET_ALL}")
+                return
+            table = [
+                [uid, username, full_name, format_currency(float(income)), format_currency(float(expense)),
+                 f"{Fore.GREEN if balance >= 0 else Fore.RED}{format_currency(float(balance))}{Style.RESET_ALL}",
+                 format_currency(float(invested)), holdings]
+                for uid, username, full_name, income, expense, balance, invested, holdings in rows
+            ]
+            print(f"\n--- Top {limit} Users by {sort_by.capitalize()} ---")
+            print(tabulate(table, headers=["ID", "Username", "Full Name", "Income", "Expense", "Balance", "Invested (₹)", "Holdings"], tablefmt="pretty"))
+        except psycopg2.Error as e:
+            print(f"{Fore.RED}Error fetching users: {e}{Style.RESET_ALL}")
+            self.conn.rollback()
+
+    def top_symbols(self, limit=10):
+        """Display the most widely held stocks."""
+        try:
+            self.cursor.execute("""
+                SELECT stock_symbol, holders, total_quantity, invested_value
+                FROM symbol_summary
+                ORDER BY invested_value DESC, stock_symbol
+                LIMIT %s
+            """, (limit,))
+            rows = self.cursor.fetchall()
+            if not rows:
+                print(f"{Fore.RED}No holdings found.{Style.RESET_ALL}")
+                return
+            table = [[symbol, holders, int(qty), format_currency(float(invested))] for symbol, holders, qty, invested in rows]
+            print(f"\n--- Top {limit} Holdings Across Users ---")
+            print(tabulate(table, headers=["Symbol", "Holders", "Total Qty", "Invested (₹)"], tablefmt="pretty"))
+        except psycopg2.Error as e:
+            print(f"{Fore.RED}Error fetching holdings: {e}{Style.RESET_ALL}")
+            self.conn.rollback()
+
+
+def main():
+    init()
+    parser = argparse.ArgumentParser(description="Cross-user admin reports and summary view refresh.")
+    parser.add_argument("--db-name", default="finance_tracker")
+    parser.add_argument("--db-user", default="postgres")
+    parser.add_argument("--password", default="your_password")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default="5432")
+    commands = parser.add_subparsers(dest="command", required=True)
+    report = commands.add_parser("report", help="Print cross-user summaries")
+    report.add_argument("--top", type=int, default=10, help="Rows in the top users/holdings tables")
+    report.add_argument("--sort", choices=sorted(USER_SORT_COLUMNS), default="balance")
+    report.add_argument("--refresh", action="store_true", help="Refresh the summary views first")
+    refresher = commands.add_parser("refresher", help="Refresh the summary views on a schedule")
+    refresher.add_argument("--interval", type=float, default=300.0, help="Seconds between refreshes")
+    args = parser.parse_args()
+
+    db_params = dict(db_name=args.db_name, user=args.db_user, password=args.password, host=args.host, port=args.port)
+    db = DatabaseManager(**db_params)
+    try:
+        setup_summaries(db.conn)  # First admin run on a database builds the views
+    except psycopg2.Error:
+        db.close()
+        raise
+    if args.command == "refresher":
+        db.close()
+        worker = SummaryRefresher(lambda: DatabaseManager(setup=False, **db_params).conn, interval=args.interval)
+        print(f"Refreshing {', '.join(SUMMARY_VIEWS)} every {args.interval:g}s. Press Ctrl+C to stop.")
+        worker.start()
+        last_reported = None
+        try:
+            while worker.is_alive():
+                worker.join(1.0)
+                if worker.last_error and worker.last_error != last_reported:
+                    print(f"{Fore.RED}Refresh failed: {worker.last_error}{Style.RESET_ALL}")
+                    last_reported = worker.last_error
+        except KeyboardInterrupt:
+            worker.stop()
+        return
+
+    try:
+        if args.refresh:
+            started = time.monotonic()
+            if refresh_summaries(db.conn):
+                print(f"{Fore.GREEN}Summary views refreshed in {time.monotonic() - started:.1f}s.{Style.RESET_ALL}")
+            else:
+                print(f"{Fore.RED}Another refresh is running; reporting current data.{Style.RESET_ALL}")
+        reports = AdminReports(db.conn)
+        reports.overview()
+        reports.top_users(args.sort, args.top)
+        reports.top_symbols(args.top)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,26 @@ import psycopg2
 from psycopg2 import sql
 
 class DatabaseManager:
-    def __init__(self, db_name="finance_tracker", user="postgres", password="Root", host="localhost", port="5432"):
-        self.conn = psycopg2.connect(
+    def __init__(self, db_name="finance_tracker", user="postgres", password="Root", host="localhost", port="5432", setup=True, connect_timeout=None):
+        self.connect_args = dict(
             dbname=db_name,
             user=user,
-            password="avin",  # Ensure this is "Root" or the password used in psql
+            password=password,
             host=host,
             port=port
         )
+        if connect_timeout:
+            self.connect_args["connect_timeout"] = connect_timeout  # Seconds; libpq waits indefinitely by default
+        self.reconnect()
+        if setup:
+            self.setup_database()
+    # ... rest of the code unchanged ...
+
+    def reconnect(self):
+        """Open a new connection and cursor; raises psycopg2.OperationalError if the server is unreachable."""
+        self.conn = psycopg2.connect(**self.connect_args)
         self.conn.set_session(autocommit=False)
         self.cursor = self.conn.cursor()
-        self.setup_database()
-    # ... rest of the code unchanged ...
 
     def setup_database(self):
         """Initialize database tables."""
@@ -42,6 +50,42 @@ class DatabaseManager:
             )
         """)
 
+        # Per-user write counter for expenses, bumped once per statement for every user it touched;
+        # expense.py compares it to decide whether cached reports are still current
+        self.cursor.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS expenses_version BIGINT NOT NULL DEFAULT 0")
+        self.cursor.execute("""
+            CREATE OR REPLACE FUNCTION bump_expenses_version() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    UPDATE users SET expenses_version = expenses_version + 1 WHERE id IN (SELECT user_id FROM new_rows);
+                ELSIF TG_OP = 'DELETE' THEN
+                    UPDATE users SET expenses_version = expenses_version + 1 WHERE id IN (SELECT user_id FROM old_rows);
+                ELSE
+                    UPDATE users SET expenses_version = expenses_version + 1
+                    WHERE id IN (SELECT user_id FROM new_rows UNION SELECT user_id FROM old_rows);
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        for event, transitions in (
+            ("INSERT", "NEW TABLE AS new_rows"),
+            ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+            ("DELETE", "OLD TABLE AS old_rows"),
+        ):
+            trigger = f"expenses_version_{event.lower()}"
+            self.cursor.execute(f"DROP TRIGGER IF EXISTS {trigger} ON expenses")
+            self.cursor.execute(f"""
+                CREATE TRIGGER {trigger} AFTER {event} ON expenses
+                REFERENCING {transitions}
+                FOR EACH STATEMENT EXECUTE PROCEDURE bump_expenses_version()
+            """)
+
+        # Trigram index for searching transaction descriptions
+        self.cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_expenses_user_id ON expenses (user_id)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_expenses_name_trgm ON expenses USING gin (name gin_trgm_ops)")
+
         # Portfolio table
         self.cursor.execute("""
             CREATE TABLE IF NOT EXISTS portfolio (
@@ -67,6 +111,16 @@ class DatabaseManager:
                 FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
             )
         """)
+
+        # Write-behind journal entries already replayed (see journal.py)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS journal_applied (
+                entry_id VARCHAR(32) PRIMARY KEY,
+                status VARCHAR(20) NOT NULL DEFAULT 'applied',
+                applied_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+        """)
+
         self.conn.commit()
 
     def close(self):
@@ -1,14 +1,74 @@
 from datetime import datetime
+from itertools import chain
 from tabulate import tabulate
-from utils import validate_date, get_valid_number, select_category, review_and_confirm, format_currency, confirm_action
+from utils import validate_date, get_valid_number, select_category, review_and_confirm, format_currency, confirm_action, stream_table, close_cursor, safe_rollback, INCOME_CATEGORIES, EXPENSE_CATEGORIES
 from colorama import Fore, Style
 import psycopg2
 from decimal import Decimal 
 
+SEARCH_PAGE_SIZE = 20
+PIVOT_GRAINS = {'month': 'Month', 'quarter': 'Quarter', 'year': 'Year'}
+
+# GROUPING(category, month, quarter, year) bitmask -> (grain, has_category)
+_PIVOT_SETS = {
+    0b0011: ('month', True), 0b0101: ('quarter', True), 0b0110: ('year', True), 0b0111: (None, True),
+    0b1011: ('month', False), 0b1101: ('quarter', False), 0b1110: ('year', False), 0b1111: (None, False),
+}
+
+# user_id -> (validity key, pivot data); see ExpenseManager.get_pivot_data
+_pivot_cache = {}
+
+def invalidate_pivot_cache(user_id):
+    """Drop the cached pivot report for a user after their transactions change."""
+    _pivot_cache.pop(user_id, None)
+
+def lock_user(cursor, user_id):
+    """Lock a user's row for the rest of the transaction; every writer of expenses, holdings or trades takes it first."""
+    cursor.execute("SELECT id FROM users WHERE id=%s FOR UPDATE", (user_id,))
+
+def insert_expense(cursor, user_id, name, category, amount, exp_type, date):
+    """Insert a transaction row; the caller commits."""
+    lock_user(cursor, user_id)
+    cursor.execute(
+        "INSERT INTO expenses (user_id, name, category, amount, type, date) VALUES (%s, %s, %s, %s, %s, %s)",
+        (user_id, name, category, amount, exp_type, date)
+    )
+
+def update_expense(cursor, user_id, expense_id, name, category, amount, exp_type, date):
+    """Update a transaction row and return the number of rows changed; the caller commits."""
+    lock_user(cursor, user_id)
+    cursor.execute(
+        "UPDATE expenses SET name=%s, category=%s, amount=%s, type=%s, date=%s WHERE id=%s AND user_id=%s",
+        (name, category, amount, exp_type, date, expense_id, user_id)
+    )
+    return cursor.rowcount
+
+def remove_expense(cursor, user_id, expense_id):
+    """Delete a transaction row and return the number of rows removed; the caller commits."""
+    lock_user(cursor, user_id)
+    cursor.execute("DELETE FROM expenses WHERE id=%s AND user_id=%s", (expense_id, user_id))
+    return cursor.rowcount
+
+def fetch_balance(cursor, user_id):
+    """Return a user's current balance (initial balance plus income minus expenses) in one query."""
+    cursor.execute("""
+        SELECT COALESCE(u.initial_balance, 0)
+               + COALESCE((SELECT SUM(CASE WHEN type='income' THEN amount ELSE -amount END) FROM expenses WHERE user_id=u.id), 0)
+        FROM users u
+        WHERE u.id=%s
+    """, (user_id,))
+    row = cursor.fetchone()
+    return float(row[0]) if row else 0.0
+
+def signed_amount(amount, exp_type):
+    """Return a transaction's effect on the balance."""
+    return float(amount) if exp_type == 'income' else -float(amount)
+
 class ExpenseManager:
-    def __init__(self, db_conn):
+    def __init__(self, db_conn, journal=None):
         self.conn = db_conn
         self.cursor = db_conn.cursor()
+        self.journal = journal
 
     def add_expense(self, user_id):
         """Add a new income or expense transaction with type, category, then description."""
@@ -37,16 +97,14 @@ class ExpenseManager:
                 return
 
             if exp_type == 'expense':
-                try:
-                    current_balance = self.get_balance(user_id)
-                    if amount > current_balance:
-                        print(f"{Fore.RED}Warning: Expense amount {format_currency(amount)} exceeds current balance {format_currency(current_balance)}.{Style.RESET_ALL}")
-                        if not confirm_action("Proceed with this expense anyway?", "Transaction cancelled due to insufficient funds."):
-                            return
-                except psycopg2.Error as e:
-                    print(f"{Fore.RED}Error checking balance: {e}{Style.RESET_ALL}")
-                    self.conn.rollback()
-                    return
+                current_balance = self.get_balance(user_id)
+                if current_balance is None:
+                    if not confirm_action("Balance is unavailable. Add this expense without checking it?", "Transaction cancelled."):
+                        return
+                elif amount > current_balance:
+                    print(f"{Fore.RED}Warning: Expense amount {format_currency(amount)} exceeds current balance {format_currency(current_balance)}.{Style.RESET_ALL}")
+                    if not confirm_action("Proceed with this expense anyway?", "Transaction cancelled due to insufficient funds."):
+                        return
 
             date_input = input("Enter date (DD-MM-YYYY, press Enter for today): ").strip()
             date = date_input if date_input and validate_date(date_input) else datetime.now().strftime('%d-%m-%Y')
@@ -63,24 +121,26 @@ class ExpenseManager:
             ):
                 return
 
-            try:
-                self.cursor.execute(
-                    "INSERT INTO expenses (user_id, name, category, amount, type, date) VALUES (%s, %s, %s, %s, %s, %s)",
-                    (user_id, name, category, amount, exp_type, date)
-                )
-                self.conn.commit()
-                print(f"{Fore.GREEN}Transaction added successfully.{Style.RESET_ALL}")
-            except psycopg2.Error as e:
-                print(f"{Fore.RED}Error adding transaction: {e}{Style.RESET_ALL}")
-                self.conn.rollback()
-                return
+            if self.journal:
+                self.journal.append(user_id, 'add_expense', balance_delta=signed_amount(amount, exp_type), name=name, category=category, amount=amount, exp_type=exp_type, date=date)
+                print(f"{Fore.GREEN}Transaction queued and will sync in the background.{Style.RESET_ALL}")
+            else:
+                try:
+                    insert_expense(self.cursor, user_id, name, category, amount, exp_type, date)
+                    self.conn.commit()
+                    invalidate_pivot_cache(user_id)
+                    print(f"{Fore.GREEN}Transaction added successfully.{Style.RESET_ALL}")
+                except psycopg2.Error as e:
+                    print(f"{Fore.RED}Error adding transaction: {e}{Style.RESET_ALL}")
+                    safe_rollback(self.conn)
+                    return
 
             if not confirm_action("Continue adding transactions?", "Stopped adding transactions."):
                 break
 
     def edit_expense(self, user_id):
         """Edit an existing expense transaction."""
-        rows = self.view_expenses(user_id)
+        rows = self.locate_expenses(user_id)
         if not rows:
             print(f"{Fore.RED}No transactions available to edit.{Style.RESET_ALL}")
             return
@@ -120,23 +180,30 @@ class ExpenseManager:
             ):
                 return
 
+            if self.journal:
+                delta = signed_amount(amount, exp_type) - signed_amount(current_amount, current_type)
+                self.journal.append(user_id, 'edit_expense', balance_delta=delta, expense_id=expense_id, name=name, category=category, amount=float(amount), exp_type=exp_type, date=date)
+                print(f"{Fore.GREEN}Update queued and will sync in the background.{Style.RESET_ALL}")
+                return
+
             try:
-                self.cursor.execute(
-                    "UPDATE expenses SET name=%s, category=%s, amount=%s, type=%s, date=%s WHERE id=%s AND user_id=%s",
-                    (name, category, amount, exp_type, date, expense_id, user_id)
-                )
+                update_expense(self.cursor, user_id, expense_id, name, category, amount, exp_type, date)
                 self.conn.commit()
+                invalidate_pivot_cache(user_id)
                 print(f"{Fore.GREEN}Transaction updated successfully.{Style.RESET_ALL}")
             except psycopg2.Error as e:
                 print(f"{Fore.RED}Error updating transaction: {e}{Style.RESET_ALL}")
-                self.conn.rollback()
+                safe_rollback(self.conn)
                 return
         except ValueError:
             print(f"{Fore.RED}Invalid Transaction ID. Enter a number from the list.{Style.RESET_ALL}")
+        except psycopg2.Error as e:
+            print(f"{Fore.RED}Error fetching transaction: {e}{Style.RESET_ALL}")
+            safe_rollback(self.conn)
 
     def delete_expense(self, user_id):
         """Delete an expense transaction."""
-        rows = self.view_expenses(user_id)
+        rows = self.locate_expenses(user_id)
         if not rows:
             print(f"{Fore.RED}No transactions available to delete.{Style.RESET_ALL}")
             return
@@ -159,62 +226,193 @@ class ExpenseManager:
             ):
                 return
 
+            if self.journal:
+                self.journal.append(user_id, 'delete_expense', balance_delta=-signed_amount(amount, trans_type), expense_id=expense_id)
+                print(f"{Fore.GREEN}Deletion queued and will sync in the background.{Style.RESET_ALL}")
+                return
+
             try:
-                self.cursor.execute("DELETE FROM expenses WHERE id=%s AND user_id=%s", (expense_id, user_id))
+                remove_expense(self.cursor, user_id, expense_id)
                 self.conn.commit()
+                invalidate_pivot_cache(user_id)
                 print(f"{Fore.GREEN}Transaction deleted successfully.{Style.RESET_ALL}")
             except psycopg2.Error as e:
                 print(f"{Fore.RED}Error deleting transaction: {e}{Style.RESET_ALL}")
-                self.conn.rollback()
+                safe_rollback(self.conn)
                 return
         except ValueError:
             print(f"{Fore.RED}Invalid Transaction ID. Enter a number from the list.{Style.RESET_ALL}")
+        except psycopg2.Error as e:
+            print(f"{Fore.RED}Error fetching transaction: {e}{Style.RESET_ALL}")
+            safe_rollback(self.conn)
 
-    def view_expenses(self, user_id):
-        """Display all transactions for a user."""
+    def view_expenses(self, user_id, pager=None):
+        """Display all transactions for a user and return how many there are; pager=False keeps them on screen."""
+        cursor = None
         try:
             self.cursor.execute("SELECT initial_balance FROM users WHERE id=%s", (user_id,))
             initial_balance = self.cursor.fetchone()[0] or Decimal('0.0')
             initial_balance = float(initial_balance)
 
-            self.cursor.execute("SELECT id, name, category, amount, type, date FROM expenses WHERE user_id=%s ORDER BY id", (user_id,))
-            rows = self.cursor.fetchall()
+            # Size the ID and amount columns from bounds over every row, not just the first screenful
+            self.cursor.execute("""
+                SELECT MAX(id), MIN(amount), MAX(amount), MIN(running), MAX(running)
+                FROM (
+                    SELECT id, amount, SUM(CASE WHEN type='income' THEN amount ELSE -amount END) OVER (ORDER BY id) AS running
+                    FROM expenses WHERE user_id=%s
+                ) t
+            """, (user_id,))
+            max_id, min_amount, max_amount, min_running, max_running = self.cursor.fetchone()
+            amount_width = max(len(format_currency(float(value))) for value in (min_amount or 0, max_amount or 0))
+            balance_width = max(len(format_currency(initial_balance + float(value))) for value in (0, min_running or 0, max_running or 0))
+            widths = [len(str(max_id or "")), None, None, None, amount_width, amount_width, balance_width]
+
+            # Server-side cursor: rows are fetched in batches while printing instead of all at once
+            cursor = self.conn.cursor(name="view_expenses")
+            cursor.itersize = 2000
+            cursor.execute("SELECT id, name, category, amount, type, date FROM expenses WHERE user_id=%s ORDER BY id", (user_id,))
+            first = cursor.fetchone()
+
+            if first is None and initial_balance == 0:
+                print(f"{Fore.RED}No transactions or initial balance found.{Style.RESET_ALL}")
+                return 0
+
+            count = 0
+
+            def table_rows():
+                nonlocal count
+                running_balance = initial_balance
+                yield ["", "", "Initial Balance", "", "", "", (format_currency(initial_balance), Fore.GREEN if initial_balance >= 0 else Fore.RED)]
+                for trans_id, name, category, amount, trans_type, date in chain([first] if first else [], cursor):
+                    count += 1
+                    amount = float(amount)
+                    running_balance += amount if trans_type == 'income' else -amount
+                    yield [
+                        trans_id,
+                        date,
+                        name,
+                        category,
+                        (format_currency(amount), Fore.GREEN) if trans_type == 'income' else "",
+                        (format_currency(amount), Fore.RED) if trans_type == 'expense' else "",
+                        (format_currency(running_balance), Fore.GREEN if running_balance >= 0 else Fore.RED),
+                    ]
 
             print("\n--- Transaction History ---")
-            table = [
-                ["", "", "Initial Balance", "", "", "", f"{Fore.GREEN if initial_balance >= 0 else Fore.RED}{format_currency(initial_balance)}{Style.RESET_ALL}"]
-            ]
-            running_balance = initial_balance
-
-            for row in rows:
-                trans_id, name, category, amount, trans_type, date = row
-                amount = float(amount)
-                income = format_currency(amount) if trans_type == 'income' else ""
-                expense = format_currency(amount) if trans_type == 'expense' else ""
-                running_balance += amount if trans_type == 'income' else -amount
-                table.append([
-                    trans_id,
-                    date,
-                    name,
-                    category,
-                    f"{Fore.GREEN}{income}{Style.RESET_ALL}" if income else "",
-                    f"{Fore.RED}{expense}{Style.RESET_ALL}" if expense else "",
-                    f"{Fore.GREEN if running_balance >= 0 else Fore.RED}{format_currency(running_balance)}{Style.RESET_ALL}"
-                ])
-
-            if not rows and initial_balance == 0:
-                print(f"{Fore.RED}No transactions or initial balance found.{Style.RESET_ALL}")
-            else:
-                print(tabulate(table, headers=["ID", "Date", "Description", "Category", "Income", "Expense", "Balance"], tablefmt="pretty"))
-            return rows
+            stream_table(["ID", "Date", "Description", "Category", "Income", "Expense", "Balance"], table_rows(),
+                         widths=widths, align="><<<>>>", truncate=(2, 3), pager=pager)
+            return count
         except psycopg2.Error as e:
             print(f"{Fore.RED}Error fetching transactions: {e}{Style.RESET_ALL}")
-            self.conn.rollback()
+            safe_rollback(self.conn)
+            return 0
+        finally:
+            close_cursor(cursor)
+
+    def locate_expenses(self, user_id):
+        """Search or list transactions so the user can pick a Transaction ID."""
+        choice = input("Search for the transaction instead of listing all? (y/n) [y]: ").strip().lower()
+        if choice in ['', 'y']:
+            return self.search_expenses(user_id)
+        return self.view_expenses(user_id, pager=False)  # The ID prompt follows, so the list must stay visible
+
+    def search_expenses(self, user_id):
+        """Search transactions by description with optional category, amount and date filters."""
+        term = input("Search description (substring or approximate, Enter for any): ").strip()
+
+        categories = INCOME_CATEGORIES + EXPENSE_CATEGORIES
+        print("\nFilter by Category:")
+        for idx, cat in enumerate(categories, 1):
+            print(f"{idx}. {cat}")
+        category_choice = input("Choose category number (Enter for any): ").strip()
+        category = None
+        if category_choice:
+            if not category_choice.isdigit() or not 1 <= int(category_choice) <= len(categories):
+                print(f"{Fore.RED}Please choose a number between 1 and {len(categories)}.{Style.RESET_ALL}")
+                return []
+            category = categories[int(category_choice) - 1]
+
+        min_amount = get_valid_number("Minimum amount (Enter for any): ", default=0.0)
+        if min_amount is None:
             return []
+        max_amount = get_valid_number("Maximum amount (Enter for any): ", default=float('inf'))
+        if max_amount is None:
+            return []
+
+        start_date = input("From date (DD-MM-YYYY, Enter for any): ").strip()
+        end_date = input("To date (DD-MM-YYYY, Enter for any): ").strip()
+        if (start_date and not validate_date(start_date)) or (end_date and not validate_date(end_date)):
+            print(f"{Fore.RED}Invalid date format. Use DD-MM-YYYY (e.g., 27-08-2025).{Style.RESET_ALL}")
+            return []
+
+        conditions = ["user_id=%s"]
+        params = [user_id]
+        order_by = "id DESC"
+        if term:
+            # ILIKE and % (trigram similarity) are both served by idx_expenses_name_trgm
+            escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("(name ILIKE %s OR name %% %s)")
+            params.extend([f"%{escaped}%", term])
+            order_by = "similarity(name, %s) DESC, id DESC"
+        if category:
+            conditions.append("category=%s")
+            params.append(category)
+        if min_amount > 0:
+            conditions.append("amount >= %s")
+            params.append(min_amount)
+        if max_amount != float('inf'):
+            conditions.append("amount <= %s")
+            params.append(max_amount)
+        if start_date:
+            conditions.append("to_date(date, 'DD-MM-YYYY') >= to_date(%s, 'DD-MM-YYYY')")
+            params.append(start_date)
+        if end_date:
+            conditions.append("to_date(date, 'DD-MM-YYYY') <= to_date(%s, 'DD-MM-YYYY')")
+            params.append(end_date)
+
+        query = f"SELECT id, date, name, category, amount, type FROM expenses WHERE {' AND '.join(conditions)} ORDER BY {order_by} LIMIT %s OFFSET %s"
+        order_params = [term] if term else []
+
+        found = []
+        page = 0
+        while True:
+            try:
+                self.cursor.execute(query, params + order_params + [SEARCH_PAGE_SIZE + 1, page * SEARCH_PAGE_SIZE])
+                rows = self.cursor.fetchall()
+            except psycopg2.Error as e:
+                print(f"{Fore.RED}Error searching transactions: {e}{Style.RESET_ALL}")
+                safe_rollback(self.conn)
+                return found
+
+            has_more = len(rows) > SEARCH_PAGE_SIZE
+            rows = rows[:SEARCH_PAGE_SIZE]
+            if not rows:
+                print(f"{Fore.RED}No matching transactions found.{Style.RESET_ALL}")
+                return found
+            found.extend(rows)
+
+            print(f"\n--- Search Results (page {page + 1}) ---")
+            table = []
+            for trans_id, date, name, category, amount, trans_type in rows:
+                color = Fore.GREEN if trans_type == 'income' else Fore.RED
+                table.append([trans_id, date, name, category, trans_type.capitalize(), f"{color}{format_currency(float(amount))}{Style.RESET_ALL}"])
+            print(tabulate(table, headers=["ID", "Date", "Description", "Category", "Type", "Amount"], tablefmt="pretty"))
+
+            options = (["n = next page"] if has_more else []) + (["p = previous page"] if page > 0 else [])
+            if not options:
+                return found
+            nav = input(f"{', '.join(options)}, Enter to continue: ").strip().lower()
+            if nav == 'n' and has_more:
+                page += 1
+            elif nav == 'p' and page > 0:
+                page -= 1
+            else:
+                return found
 
     def view_balance(self, user_id):
         """Display current balance for a user."""
         balance = self.get_balance(user_id)
+        if balance is None:
+            return
         print(f"\nBalance: {Fore.GREEN if balance >= 0 else Fore.RED}{format_currency(balance)}{Style.RESET_ALL}")
 
     def monthly_summary(self, user_id):
@@ -257,23 +455,135 @@ class ExpenseManager:
             print(tabulate(table, headers="firstrow", tablefmt="pretty"))
         except psycopg2.Error as e:
             print(f"{Fore.RED}Error fetching monthly summary: {e}{Style.RESET_ALL}")
-            self.conn.rollback()
+            safe_rollback(self.conn)
+
+    def get_pivot_data(self, user_id):
+        """Return category/period totals for every grain, computed in one GROUPING SETS pass and cached.
+
+        The cache is checked against users.expenses_version, which a trigger on expenses bumps on
+        every insert, update or delete, so writes from other sessions, batch jobs or direct SQL are
+        picked up with a single-row lookup instead of re-running the grouping query.
+        """
+        self.cursor.execute("SELECT expenses_version FROM users WHERE id=%s", (user_id,))
+        row = self.cursor.fetchone()
+        key = row[0] if row else None
+        cached = _pivot_cache.get(user_id)
+        if cached and key is not None and cached[0] == key:
+            return cached[1]
+
+        self.cursor.execute("""
+            SELECT
+                type, category, month, quarter, year,
+                GROUPING(category, month, quarter, year) AS grouping_id,
+                SUM(amount)
+            FROM (
+                SELECT
+                    type,
+                    category,
+                    amount,
+                    to_char(to_date(date, 'DD-MM-YYYY'), 'YYYY-MM') AS month,
+                    to_char(to_date(date, 'DD-MM-YYYY'), 'YYYY-"Q"Q') AS quarter,
+                    to_char(to_date(date, 'DD-MM-YYYY'), 'YYYY') AS year
+                FROM expenses
+                WHERE user_id=%s
+            ) t
+            GROUP BY GROUPING SETS (
+                (type, category, month), (type, category, quarter), (type, category, year), (type, category),
+                (type, month), (type, quarter), (type, year), (type)
+            )
+        """, (user_id,))
+
+        data = {
+            trans_type: {
+                'cells': {grain: {} for grain in PIVOT_GRAINS},
+                'periods': {grain: {} for grain in PIVOT_GRAINS},
+                'categories': {},
+                'total': 0.0,
+            }
+            for trans_type in ('income', 'expense')
+        }
+        for trans_type, category, month, quarter, year, grouping_id, total in self.cursor.fetchall():
+            grain, has_category = _PIVOT_SETS[grouping_id]
+            period = {'month': month, 'quarter': quarter, 'year': year}.get(grain)
+            total = float(total or 0.0)
+            report = data[trans_type]
+            if grain and has_category:
+                report['cells'][grain][(category, period)] = total
+            elif grain:
+                report['periods'][grain][period] = total
+            elif has_category:
+                report['categories'][category] = total
+            else:
+                report['total'] = total
+
+        _pivot_cache[user_id] = (key, data)
+        return data
+
+    def category_pivot(self, user_id):
+        """Display a category-by-period spending breakdown with subtotals and grand total."""
+        print("\nSelect type:")
+        print("1. Expense")
+        print("2. Income")
+        type_choice = input("Choose type number [1]: ").strip()
+        trans_type = 'expense' if type_choice in ['', '1'] else 'income' if type_choice == '2' else None
+        if trans_type is None:
+            print(f"{Fore.RED}Invalid type. Choose 1 for Expense or 2 for Income.{Style.RESET_ALL}")
+            return
+
+        grains = list(PIVOT_GRAINS)
+        print("\nSelect period:")
+        for idx, grain in enumerate(grains, 1):
+            print(f"{idx}. {PIVOT_GRAINS[grain]}")
+        grain_choice = input("Choose period number [1]: ").strip() or '1'
+        if not grain_choice.isdigit() or not 1 <= int(grain_choice) <= len(grains):
+            print(f"{Fore.RED}Please choose a number between 1 and {len(grains)}.{Style.RESET_ALL}")
+            return
+        grain = grains[int(grain_choice) - 1]
+
+        try:
+            report = self.get_pivot_data(user_id)[trans_type]
+        except psycopg2.Error as e:
+            print(f"{Fore.RED}Error building pivot report: {e}{Style.RESET_ALL}")
+            safe_rollback(self.conn)
+            return
+
+        periods = sorted(report['periods'][grain])
+        if not periods:
+            print(f"{Fore.RED}No {trans_type} transactions found for the pivot report.{Style.RESET_ALL}")
+            return
+
+        known = INCOME_CATEGORIES if trans_type == 'income' else EXPENSE_CATEGORIES
+        categories = known + sorted((c for c in report['categories'] if c not in known), key=str)
+        cells = report['cells'][grain]
+
+        def cell(value):
+            return format_currency(value) if value else ""
+
+        table = []
+        for category in categories:
+            row = [category] + [cell(cells.get((category, period), 0.0)) for period in periods]
+            row.append(cell(report['categories'].get(category, 0.0)))
+            table.append(row)
+        color = Fore.GREEN if trans_type == 'income' else Fore.RED
+        table.append(
+            [f"{color}Total{Style.RESET_ALL}"]
+            + [f"{color}{format_currency(report['periods'][grain][period])}{Style.RESET_ALL}" for period in periods]
+            + [f"{color}{format_currency(report['total'])}{Style.RESET_ALL}"]
+        )
+
+        print(f"\n--- {trans_type.capitalize()} by Category and {PIVOT_GRAINS[grain]} ---")
+        print(tabulate(table, headers=["Category"] + periods + ["Total"], tablefmt="pretty"))
 
     def get_balance(self, user_id):
-        """Calculate current balance for a user."""
+        """Calculate current balance for a user, including queued journal writes; None if it cannot be read."""
         try:
-            self.cursor.execute("SELECT initial_balance FROM users WHERE id=%s", (user_id,))
-            initial_balance = self.cursor.fetchone()[0] or Decimal('0.0')
-            self.cursor.execute("SELECT SUM(amount) FROM expenses WHERE user_id=%s AND type='income'", (user_id,))
-            income = self.cursor.fetchone()[0] or Decimal('0.0')
-            self.cursor.execute("SELECT SUM(amount) FROM expenses WHERE user_id=%s AND type='expense'", (user_id,))
-            expense = self.cursor.fetchone()[0] or Decimal('0.0')
-            
-            return float(initial_balance) + float(income) - float(expense)
+            if self.journal:
+                return self.journal.projected_balance(user_id, lambda: fetch_balance(self.cursor, user_id))
+            return fetch_balance(self.cursor, user_id)
         except psycopg2.Error as e:
             print(f"{Fore.RED}Error calculating balance: {e}{Style.RESET_ALL}")
-            self.conn.rollback()
-            return 0.0
+            safe_rollback(self.conn)
+            return None
 
     def expense_menu(self, user_id, full_name):
         """Display and handle expense management menu."""
@@ -285,7 +595,9 @@ class ExpenseManager:
             print("4. Edit Income/Expense Transaction")
             print("5. Delete Income/Expense Transaction")
             print("6. Monthly Summary")
-            print("7. Back")
+            print("7. Search Transactions")
+            print("8. Category Pivot Report")
+            print("9. Back")
             sub_choice = input("Choose an option: ").strip()
 
             if sub_choice == '1':
@@ -301,8 +613,12 @@ class ExpenseManager:
             elif sub_choice == '6':
                 self.monthly_summary(user_id)
             elif sub_choice == '7':
+                self.search_expenses(user_id)
+            elif sub_choice == '8':
+                self.category_pivot(user_id)
+            elif sub_choice == '9':
                 if confirm_action("back to the home menu?", "Cancelled. Returning to expense menu."):
                     print(f"{Fore.GREEN}Returning to home menu.{Style.RESET_ALL}")
                     break
             else:
-                print(f"{Fore.RED}Invalid option. Choose 1 to 7.{Style.RESET_ALL}")
\ No newline at end of file
+                print(f"{Fore.RED}Invalid option. Choose 1 to 9.{Style.RESET_ALL}")
\ No newline at end of file
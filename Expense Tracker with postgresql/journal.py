@@ -0,0 +1,407 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from colorama import Fore, Style
+import psycopg2
+from expense import insert_expense, update_expense, remove_expense, invalidate_pivot_cache
+from stock import apply_buy, apply_sell
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, so only one instance may use a journal file
+    fcntl = None
+
+
+def _replay_edit(cursor, user_id, expense_id, **fields):
+    if update_expense(cursor, user_id, expense_id, **fields) == 0:
+        raise ValueError(f"Transaction ID {expense_id} no longer exists.")
+
+
+def _replay_delete(cursor, user_id, expense_id):
+    if remove_expense(cursor, user_id, expense_id) == 0:
+        raise ValueError(f"Transaction ID {expense_id} no longer exists.")
+
+
+REPLAYERS = {
+    'add_expense': insert_expense,
+    'edit_expense': _replay_edit,
+    'delete_expense': _replay_delete,
+    'buy': apply_buy,
+    'sell': apply_sell,
+}
+
+# Errors that mean the database link is down: keep the entries and retry later
+LINK_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+class JournalLockedError(RuntimeError):
+    """Raised when another running instance already owns the journal file."""
+
+
+def _is_entry(entry):
+    """Return True if a decoded journal line has the shape append() writes."""
+    return (
+        isinstance(entry, dict)
+        and isinstance(entry.get('id'), str)
+        and isinstance(entry.get('user_id'), int) and not isinstance(entry.get('user_id'), bool)
+        and entry.get('op') in REPLAYERS
+        and isinstance(entry.get('args'), dict)
+        and isinstance(entry.get('delta', {}), dict)
+    )
+
+
+def _entry_delta(entry):
+    """Return (balance delta, {symbol: quantity delta}) recorded with an entry."""
+    delta = entry.get('delta') or {}
+    try:
+        holdings = {str(symbol): int(qty) for symbol, qty in (delta.get('holdings') or {}).items()}
+        return float(delta.get('balance', 0.0)), holdings
+    except (TypeError, ValueError, AttributeError):
+        return 0.0, {}
+
+
+class WriteJournal:
+    """Write-behind journal: writes are appended to a local file and replayed to Postgres in the background.
+
+    append() returns as soon as the entry is written to the OS; a syncer thread fsyncs the
+    file every `fsync_interval` seconds, so several entries share one fsync. A flusher thread
+    replays entries in file order (which keeps each user's writes in order) in batches of
+    `batch_size`, one transaction per batch. Every entry carries a unique ID recorded in the
+    journal_applied table in the same transaction, so replaying an entry twice is a no-op.
+    Entries the database rejects are logged to `<path>.conflicts` and kept for their user in
+    `<path>.unreported` until take_conflicts() hands them over.
+
+    Pre-write checks do not need the database either: projected_balance() and
+    projected_holdings() combine a per-user base value, read once and then kept current as
+    entries replay, with the deltas of entries still waiting in the journal. Logging in and
+    the first balance or holdings read for a user still need the database.
+
+    The journal file is locked exclusively, so only one running instance can use it.
+    """
+
+    def __init__(self, path, connect, batch_size=200, flush_interval=2.0, fsync_interval=0.05):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.conflict_path = path + ".conflicts"
+        self.unreported_path = path + ".unreported"
+        self.connect = connect
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.last_error = None
+
+        self._file = open(path, "a", encoding="utf-8")
+        if fcntl:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._file.close()
+                raise JournalLockedError(f"Journal {path} is in use by another running instance.")
+
+        self._lock = threading.Lock()  # Journal file, offset and conflict state
+        self._ledger_lock = threading.RLock()  # Pending deltas and base values
+        self._dirty = False
+        self._conn = None
+        self._pending = {}  # entry id -> (user_id, balance delta, holdings delta)
+        self._base_balance = {}
+        self._base_holdings = {}
+        self._unreported = self._load_unreported()
+        self._offset = self._load_offset()
+        self._load_pending()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._syncer = threading.Thread(target=self._sync_loop, name="journal-sync", daemon=True)
+        self._flusher = threading.Thread(target=self._flush_loop, name="journal-flush", daemon=True)
+        self._syncer.start()
+        self._flusher.start()
+
+    def append(self, user_id, op, balance_delta=0.0, holdings_delta=None, **args):
+        """Append a write to the journal and return its entry ID.
+
+        `balance_delta` and `holdings_delta` describe the entry's effect on the user's balance and
+        share quantities, so checks made before it replays can account for it.
+        """
+        if op not in REPLAYERS:
+            raise ValueError(f"Unknown journal operation: {op}")
+        entry = {
+            'id': uuid.uuid4().hex,
+            'user_id': user_id,
+            'op': op,
+            'args': args,
+            'delta': {'balance': balance_delta, 'holdings': holdings_delta or {}},
+            'ts': datetime.now().isoformat(),
+        }
+        line = json.dumps(entry) + "\n"
+        # Registered before the line is written, so the flusher can never replay it first
+        with self._ledger_lock:
+            self._pending[entry['id']] = (user_id,) + _entry_delta(entry)
+        try:
+            with self._lock:
+                self._file.write(line)
+                self._file.flush()
+                self._dirty = True
+        except OSError:
+            with self._ledger_lock:
+                self._pending.pop(entry['id'], None)
+            raise
+        return entry['id']
+
+    def projected_balance(self, user_id, fetch):
+        """Return the user's balance including queued writes; `fetch` reads it from the database once."""
+        with self._ledger_lock:
+            if user_id not in self._base_balance:
+                self._base_balance[user_id] = float(fetch())
+            pending = sum(delta for uid, delta, _ in self._pending.values() if uid == user_id)
+            return self._base_balance[user_id] + pending
+
+    def projected_holdings(self, user_id, fetch):
+        """Return {symbol: quantity} including queued trades; `fetch` reads holdings from the database once."""
+        with self._ledger_lock:
+            if user_id not in self._base_holdings:
+                self._base_holdings[user_id] = dict(fetch())
+            holdings = dict(self._base_holdings[user_id])
+            for uid, _, deltas in self._pending.values():
+                if uid == user_id:
+                    for symbol, qty in deltas.items():
+                        holdings[symbol] = holdings.get(symbol, 0) + qty
+            return {symbol: qty for symbol, qty in holdings.items() if qty > 0}
+
+    def refresh_base(self, user_id, fetch_balance, fetch_holdings):
+        """Re-read a user's base values (e.g. at login) to pick up writes made elsewhere; keeps the old ones if offline."""
+        with self._ledger_lock:
+            try:
+                balance, holdings = float(fetch_balance()), dict(fetch_holdings())
+            except psycopg2.Error:
+                return False
+            self._base_balance[user_id] = balance
+            self._base_holdings[user_id] = holdings
+            return True
+
+    def take_conflicts(self, user_id):
+        """Return and clear a user's conflicts that have not been reported yet."""
+        with self._lock:
+            conflicts = self._unreported.pop(user_id, [])
+            if conflicts:
+                self._save_unreported()
+        return conflicts
+
+    def report_conflicts(self, user_id):
+        """Print a user's conflicts found since they were last reported."""
+        for conflict in self.take_conflicts(user_id):
+            print(f"{Fore.RED}A queued {conflict.get('op')} from {conflict.get('ts', '')[:10]} was rejected: {conflict['reason']}{Style.RESET_ALL}")
+
+    def pending_bytes(self):
+        """Return how much of the journal has not yet been replayed."""
+        with self._lock:
+            return os.path.getsize(self.path) - self._offset
+
+    def close(self, timeout=5.0):
+        """Stop the background threads after a final fsync and at most one more replayed batch.
+
+        Waits up to `timeout` seconds for a replay already in progress; whatever is still queued
+        replays next session from the saved offset, so exiting never waits on a large backlog.
+        """
+        self._stop.set()
+        self._wake.set()
+        self._flusher.join(timeout)
+        self._syncer.join(timeout)
+        try:
+            self._sync()
+            if not self._flusher.is_alive():
+                self.replay()
+            pending = self.pending_bytes()
+            if pending:
+                print(f"{Fore.YELLOW}{pending} bytes of queued writes will sync next session.{Style.RESET_ALL}")
+        except Exception as e:
+            print(f"{Fore.RED}Could not sync the journal; queued writes will sync next session: {e}{Style.RESET_ALL}")
+        finally:
+            self._file.close()  # Also releases the flock
+            if self._conn is not None and not self._flusher.is_alive():
+                self._drop_connection()
+
+    def replay(self):
+        """Replay one batch of journal entries to Postgres and return how many were processed."""
+        batch = self._read_batch()
+        if not batch:
+            self._compact()
+            return 0
+
+        if self._conn is None or self._conn.closed:
+            self._conn = self.connect()
+        cursor = self._conn.cursor()
+        applied, conflicts, already_applied = [], [], []
+        try:
+            for entry, _ in batch:
+                if entry is None:
+                    continue
+                cursor.execute("SAVEPOINT journal_entry")
+                cursor.execute("INSERT INTO journal_applied (entry_id) VALUES (%s) ON CONFLICT DO NOTHING", (entry['id'],))
+                if cursor.rowcount == 0:  # Already replayed before a crash or reconnect
+                    cursor.execute("RELEASE SAVEPOINT journal_entry")
+                    already_applied.append(entry)
+                    continue
+                try:
+                    REPLAYERS[entry['op']](cursor, entry['user_id'], **entry['args'])
+                    cursor.execute("RELEASE SAVEPOINT journal_entry")
+                    applied.append(entry)
+                except LINK_ERRORS:
+                    raise
+                except Exception as e:  # Rejected by the database or malformed arguments: a conflict, not a retry
+                    cursor.execute("ROLLBACK TO SAVEPOINT journal_entry")
+                    cursor.execute("INSERT INTO journal_applied (entry_id, status) VALUES (%s, 'conflict')", (entry['id'],))
+                    conflicts.append(dict(entry, reason=str(e).strip()))
+            # Commit and fold under the ledger lock so base reads never see an entry both committed and pending
+            with self._ledger_lock:
+                self._conn.commit()
+                self._settle(applied, conflicts, already_applied)
+        except LINK_ERRORS:
+            self._drop_connection()
+            raise
+        except Exception:
+            try:
+                self._conn.rollback()
+            except psycopg2.Error:
+                self._drop_connection()
+            raise
+        finally:
+            if not cursor.closed:
+                cursor.close()
+
+        unreadable = [dict(meta, reason="Unreadable journal entry.") for entry, meta in batch if entry is None]
+        self._record_conflicts(conflicts, unreadable)
+        self._save_offset(batch[-1][1]['end'])
+        for user_id in {entry['user_id'] for entry in applied + conflicts + already_applied}:
+            invalidate_pivot_cache(user_id)
+        return len(batch)
+
+    def _settle(self, applied, conflicts, already_applied):
+        """Move replayed entries out of the pending deltas (caller holds the ledger lock)."""
+        for entry in applied:
+            user_id, balance, holdings = self._pending.pop(entry['id'], (entry['user_id'],) + _entry_delta(entry))
+            if user_id in self._base_balance:
+                self._base_balance[user_id] += balance
+            if user_id in self._base_holdings:
+                base = self._base_holdings[user_id]
+                for symbol, qty in holdings.items():
+                    base[symbol] = base.get(symbol, 0) + qty
+        for entry in conflicts:
+            self._pending.pop(entry['id'], None)
+        for entry in already_applied:
+            # The database may or may not have been read after this entry committed: re-read next time
+            self._pending.pop(entry['id'], None)
+            self._base_balance.pop(entry['user_id'], None)
+            self._base_holdings.pop(entry['user_id'], None)
+
+    def _read_batch(self, limit=None):
+        """Read up to `limit` (default batch_size) complete entries after the replay offset.
+
+        Each item is (entry, {'end': offset after the line}); entry is None for a line that is
+        not valid JSON or does not have the shape append() writes.
+        """
+        limit = self.batch_size if limit is None else limit
+        batch = []
+        offset = self._offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while limit is None or len(batch) < limit:
+                raw = f.readline()
+                if not raw.endswith(b"\n"):  # Missing or partially written last line
+                    break
+                offset += len(raw)
+                try:
+                    entry = json.loads(raw)
+                except ValueError:
+                    entry = None
+                if not _is_entry(entry):
+                    batch.append((None, {'raw': raw.decode("utf-8", "replace").strip(), 'end': offset}))
+                    continue
+                batch.append((entry, {'end': offset}))
+        return batch
+
+    def _load_pending(self):
+        """Register the deltas of entries left unreplayed by a previous session."""
+        for entry, _ in self._read_batch(limit=float("inf")):
+            if entry is not None:
+                self._pending[entry['id']] = (entry['user_id'],) + _entry_delta(entry)
+
+    def _compact(self):
+        """Truncate the journal once every entry has been replayed."""
+        with self._lock:
+            if self._offset and os.path.getsize(self.path) == self._offset:
+                self._save_offset(0)  # Saved first: a crash before truncating only causes a harmless re-replay
+                os.ftruncate(self._file.fileno(), 0)
+
+    def _record_conflicts(self, conflicts, unreadable=()):
+        if not conflicts and not unreadable:
+            return
+        with open(self.conflict_path, "a", encoding="utf-8") as f:
+            for conflict in list(conflicts) + list(unreadable):
+                f.write(json.dumps(conflict) + "\n")
+        if conflicts:
+            with self._lock:
+                for conflict in conflicts:
+                    self._unreported.setdefault(conflict['user_id'], []).append(conflict)
+                self._save_unreported()
+
+    def _load_unreported(self):
+        try:
+            with open(self.unreported_path, encoding="utf-8") as f:
+                return {int(user_id): conflicts for user_id, conflicts in json.load(f).items()}
+        except (FileNotFoundError, ValueError, AttributeError):
+            return {}
+
+    def _save_unreported(self):
+        tmp_path = self.unreported_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({str(user_id): conflicts for user_id, conflicts in self._unreported.items()}, f)
+        os.replace(tmp_path, self.unreported_path)
+
+    def _load_offset(self):
+        try:
+            with open(self.offset_path, encoding="utf-8") as f:
+                offset = int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+        return offset if offset <= os.path.getsize(self.path) else 0
+
+    def _save_offset(self, offset):
+        tmp_path = self.offset_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.offset_path)
+        self._offset = offset
+
+    def _drop_connection(self):
+        try:
+            self._conn.close()
+        except psycopg2.Error:
+            pass
+        self._conn = None
+
+    def _sync(self):
+        with self._lock:
+            if self._dirty:
+                os.fsync(self._file.fileno())
+                self._dirty = False
+
+    def _sync_loop(self):
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                self._sync()
+            except OSError as e:
+                self.last_error = str(e)
+
+    def _flush_loop(self):
+        while not self._stop.is_set():
+            try:
+                if self.replay():
+                    self.last_error = None
+                    continue
+            except Exception as e:  # Link down or unexpected failure: entries stay in the journal for the next attempt
+                self.last_error = str(e).strip()
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
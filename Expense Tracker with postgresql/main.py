@@ -1,21 +1,54 @@
+import os
+import psycopg2
 from database import DatabaseManager
 from user import UserManager
-from expense import ExpenseManager
-from stock import StockManager
-from utils import confirm_action
+from expense import ExpenseManager, fetch_balance
+from stock import StockManager, fetch_holdings
+from journal import WriteJournal, JournalLockedError
+from utils import confirm_action, safe_rollback
 from colorama import init, Fore, Style
 
+# Seconds to wait for the database before treating it as unreachable (reconnects and journal sync)
+CONNECT_TIMEOUT = 10
+
+def ensure_connection(db, managers):
+    """Reconnect after the database link was lost and point the managers at the new connection."""
+    if not db.conn.closed:
+        return True
+    try:
+        db.reconnect()
+    except psycopg2.OperationalError:
+        print(f"{Fore.RED}Database is unreachable; queued writes will sync once it is back.{Style.RESET_ALL}")
+        return False
+    for manager in managers:
+        manager.conn = db.conn
+        manager.cursor = db.conn.cursor()
+    print(f"{Fore.GREEN}Reconnected to the database.{Style.RESET_ALL}")
+    return True
+
 def main():
     init()  # Initialize colorama
-    db = DatabaseManager(db_name="finance_tracker", user="postgres", password="your_password", host="localhost", port="5432")
+    db_params = dict(db_name="finance_tracker", user="postgres", password="your_password", host="localhost", port="5432", connect_timeout=CONNECT_TIMEOUT)
+    db = DatabaseManager(**db_params)
+    # Set FINANCE_TRACKER_JOURNAL to a file path to queue writes locally and sync them in the background.
+    # Only writes are deferred: logging in and the first balance/holdings read of a session need the database.
+    journal_path = os.environ.get("FINANCE_TRACKER_JOURNAL")
+    try:
+        journal = WriteJournal(journal_path, connect=lambda: DatabaseManager(setup=False, **db_params).conn) if journal_path else None
+    except JournalLockedError as e:
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}")
+        db.close()
+        return
     try:
         user_manager = UserManager(db.conn)
-        expense_manager = ExpenseManager(db.conn)
-        stock_manager = StockManager(db.conn)
+        expense_manager = ExpenseManager(db.conn, journal=journal)
+        stock_manager = StockManager(db.conn, journal=journal)
+        managers = (user_manager, expense_manager, stock_manager)
 
         while True:
             user_id, full_name = None, None
             while not user_id:
+                ensure_connection(db, managers)
                 print("\n--- Welcome to Finance Tracker ---")
                 print("1. Register")
                 print("2. Login")
@@ -33,28 +66,42 @@ def main():
                 else:
                     print(f"{Fore.RED}Invalid option. Choose 1, 2, or 3.{Style.RESET_ALL}")
 
+            if journal and not journal.refresh_base(user_id, lambda: fetch_balance(db.cursor, user_id), lambda: fetch_holdings(db.cursor, user_id)):
+                safe_rollback(db.conn)
+
             while True:
+                ensure_connection(db, managers)
+                if journal:
+                    journal.report_conflicts(user_id)
                 print(f"\n--- Welcome, {full_name} ---")
                 print("1. Expense Management")
                 print("2. Stock Management")
                 print("3. Logout")
                 choice = input("Choose an option: ").strip()
 
-                if choice == '1':
-                    expense_manager.expense_menu(user_id, full_name)
-                elif choice == '2':
-                    stock_manager.stock_menu(user_id, full_name)
-                elif choice == '3':
-                    if confirm_action("logout to the main menu?", "Cancelled."):
-                        print(f"{Fore.GREEN}Returning to main menu.{Style.RESET_ALL}")
-                        break
-                else:
-                    print(f"{Fore.RED}Invalid option. Choose 1, 2, or 3.{Style.RESET_ALL}")
+                try:
+                    if choice == '1':
+                        expense_manager.expense_menu(user_id, full_name)
+                    elif choice == '2':
+                        stock_manager.stock_menu(user_id, full_name)
+                    elif choice == '3':
+                        if confirm_action("logout to the main menu?", "Cancelled."):
+                            print(f"{Fore.GREEN}Returning to main menu.{Style.RESET_ALL}")
+                            break
+                    else:
+                        print(f"{Fore.RED}Invalid option. Choose 1, 2, or 3.{Style.RESET_ALL}")
+                except psycopg2.Error as e:
+                    print(f"{Fore.RED}Database error: {str(e).strip()}. Returning to the home menu.{Style.RESET_ALL}")
+                    safe_rollback(db.conn)
 
     except Exception as e:
         print(f"{Fore.RED}An error occurred: {e}{Style.RESET_ALL}")
     finally:
-        db.close()  # Cleanly close DB connection
+        try:
+            if journal:
+                journal.close()  # Final fsync and one more replayed batch; the rest syncs next session
+        finally:
+            db.close()  # Cleanly close DB connection
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
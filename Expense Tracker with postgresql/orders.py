@@ -0,0 +1,261 @@
+import argparse
+import csv
+import time
+from datetime import datetime
+from colorama import init, Fore, Style
+import psycopg2
+from psycopg2.extras import execute_values
+from database import DatabaseManager
+from expense import invalidate_pivot_cache
+from stock import fetch_quotes
+from symbols import SymbolMaster
+from utils import normalize_stock_symbol, format_currency
+
+FILLED = "FILLED"
+REJECTED = "REJECTED"
+
+
+def parse_order(fields, line=None):
+    """Build an order dict from user_id/side/symbol/quantity[/price] fields; raises ValueError if malformed."""
+    side = str(fields.get("side", "")).strip().upper()
+    if side not in ("BUY", "SELL"):
+        raise ValueError("side must be BUY or SELL")
+    symbol = str(fields.get("symbol", "")).strip()
+    if not symbol:
+        raise ValueError("symbol is required")
+    try:
+        user_id = int(fields["user_id"])
+        quantity = int(fields["quantity"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("user_id and quantity must be whole numbers")
+    if quantity < 1:
+        raise ValueError("quantity must be at least 1")
+    price = fields.get("price")
+    if price in (None, ""):
+        price = None
+    else:
+        try:
+            price = round(float(price), 2)
+        except ValueError:
+            raise ValueError("price must be a number")
+        if price <= 0:
+            raise ValueError("price must be positive")
+    return {"line": line, "user_id": user_id, "side": side, "symbol": normalize_stock_symbol(symbol), "quantity": quantity, "price": price}
+
+
+class OrderEngine:
+    """Executes queued buy/sell orders in bulk.
+
+    Orders are priced with one batched quote fetch, then processed in chunks of users. Each chunk
+    is one transaction: it locks the users' rows (the same lock expense.lock_user takes for every
+    other writer, so they cannot overdraw a balance), loads balances and holdings in two queries,
+    validates each order against the projected balance and holdings in order, and writes the
+    accepted orders with multi-row statements.
+    """
+
+    def __init__(self, db_conn, symbols=None, users_per_transaction=500):
+        self.conn = db_conn
+        self.cursor = db_conn.cursor()
+        self.symbols = symbols if symbols is not None else SymbolMaster.load(download=True)
+        self.users_per_transaction = users_per_transaction
+
+    def load_orders(self, path):
+        """Read orders from a CSV file; malformed rows come back as rejected results."""
+        orders, results = [], []
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for line, row in enumerate(csv.DictReader(f), 2):
+                row = {key.strip().lower(): value for key, value in row.items() if key}
+                try:
+                    orders.append(parse_order(row, line))
+                except ValueError as e:
+                    results.append(self._result(dict(row, line=line), REJECTED, str(e)))
+        return orders, results
+
+    def execute(self, orders):
+        """Execute a list of parsed orders and return one result dict per order, in input order."""
+        results = {}
+        priced = []
+        for idx, order in enumerate(orders):
+            if order["side"] == "BUY" and not self.symbols.is_valid(order["symbol"]):
+                results[idx] = self._result(order, REJECTED, "Unknown NSE symbol")
+            else:
+                priced.append(idx)
+
+        quotes = fetch_quotes(orders[idx]["symbol"] for idx in priced if orders[idx]["price"] is None)
+        by_user = {}
+        for idx in priced:
+            order = orders[idx]
+            price = order["price"] if order["price"] is not None else quotes.get(order["symbol"])
+            if price is None:
+                results[idx] = self._result(order, REJECTED, "No price data")
+                continue
+            by_user.setdefault(order["user_id"], []).append((idx, dict(order, price=price)))
+
+        user_ids = sorted(by_user)
+        for start in range(0, len(user_ids), self.users_per_transaction):
+            chunk = {uid: by_user[uid] for uid in user_ids[start:start + self.users_per_transaction]}
+            results.update(self._execute_chunk(chunk))
+
+        return [results[idx] for idx in range(len(orders))]
+
+    def _execute_chunk(self, by_user):
+        """Validate and write the orders of a group of users in a single transaction."""
+        results = {}
+        user_ids = list(by_user)
+        date = datetime.now().strftime("%d-%m-%Y")
+        try:
+            self.cursor.execute("SELECT id FROM users WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (user_ids,))
+            self.cursor.execute("""
+                SELECT u.id,
+                       COALESCE(u.initial_balance, 0)
+                       + COALESCE(SUM(CASE WHEN e.type='income' THEN e.amount WHEN e.type='expense' THEN -e.amount END), 0)
+                FROM users u
+                LEFT JOIN expenses e ON e.user_id = u.id
+                WHERE u.id = ANY(%s)
+                GROUP BY u.id
+            """, (user_ids,))
+            balances = {uid: float(balance) for uid, balance in self.cursor.fetchall()}
+
+            self.cursor.execute(
+                "SELECT id, user_id, stock_symbol, quantity, avg_buy_price FROM portfolio WHERE user_id = ANY(%s) ORDER BY id FOR UPDATE",
+                (user_ids,)
+            )
+            holdings = {}
+            for pid, uid, symbol, qty, avg_price in self.cursor.fetchall():
+                # Keep the first row per symbol, as buy_stock/sell_stock do
+                holdings.setdefault((uid, symbol), {"id": pid, "quantity": int(qty), "avg": float(avg_price), "changed": False})
+
+            trades, expenses = [], []
+            for uid, orders in by_user.items():
+                if uid not in balances:
+                    for idx, order in orders:
+                        results[idx] = self._result(order, REJECTED, "Unknown user")
+                    continue
+                for idx, order in orders:
+                    reason = self._apply(order, balances, holdings)
+                    if reason:
+                        results[idx] = self._result(order, REJECTED, reason)
+                        continue
+                    total = float(order["quantity"] * order["price"])
+                    trades.append((uid, order["symbol"], order["side"], order["quantity"], order["price"], date))
+                    if order["side"] == "BUY":
+                        expenses.append((uid, f"Buy {order['symbol']}", "Stock Purchase", total, "expense", date))
+                    else:
+                        expenses.append((uid, f"Sell {order['symbol']}", "Stock Sale", total, "income", date))
+                    results[idx] = self._result(order, FILLED)
+
+            self._write(holdings, trades, expenses)
+            self.conn.commit()
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            reason = f"Database error: {str(e).strip()}"
+            return {idx: self._result(order, REJECTED, reason) for orders in by_user.values() for idx, order in orders}
+
+        for uid in user_ids:
+            invalidate_pivot_cache(uid)
+        return results
+
+    def _apply(self, order, balances, holdings):
+        """Apply an order to the projected balance and holdings, or return a rejection reason."""
+        uid, symbol, quantity, price = order["user_id"], order["symbol"], order["quantity"], order["price"]
+        total = float(quantity * price)
+        holding = holdings.get((uid, symbol))
+        if order["side"] == "BUY":
+            if total > balances[uid]:
+                return f"Insufficient funds. Need {format_currency(total)}, but balance is {format_currency(balances[uid])}."
+            if holding is None:
+                holding = holdings[(uid, symbol)] = {"id": None, "quantity": 0, "avg": 0.0, "changed": True}
+            new_qty = holding["quantity"] + quantity
+            holding["avg"] = float(((holding["quantity"] * holding["avg"]) + (quantity * price)) / new_qty)
+            holding["quantity"] = new_qty
+            balances[uid] -= total
+        else:
+            held = holding["quantity"] if holding else 0
+            if held == 0:
+                return f"You do not own any shares of {symbol}."
+            if quantity > held:
+                return f"You only have {held} shares of {symbol}."
+            holding["quantity"] -= quantity
+            balances[uid] += total
+        holding["changed"] = True
+        return None
+
+    def _write(self, holdings, trades, expenses):
+        """Write the projected portfolio changes and trade rows with multi-row statements."""
+        updates, inserts, deletes = [], [], []
+        for (uid, symbol), holding in holdings.items():
+            if not holding["changed"]:
+                continue
+            if holding["id"] is None:
+                if holding["quantity"] > 0:
+                    inserts.append((uid, symbol, holding["quantity"], holding["avg"]))
+            elif holding["quantity"] == 0:
+                deletes.append(holding["id"])
+            else:
+                updates.append((holding["id"], holding["quantity"], holding["avg"]))
+
+        if deletes:
+            self.cursor.execute("DELETE FROM portfolio WHERE id = ANY(%s)", (deletes,))
+        if updates:
+            execute_values(self.cursor, """
+                UPDATE portfolio p SET quantity = v.quantity, avg_buy_price = v.avg_buy_price
+                FROM (VALUES %s) AS v(id, quantity, avg_buy_price)
+                WHERE p.id = v.id
+            """, updates, template="(%s, %s, %s::numeric)")
+        if inserts:
+            execute_values(self.cursor, "INSERT INTO portfolio (user_id, stock_symbol, quantity, avg_buy_price) VALUES %s", inserts)
+        if trades:
+            execute_values(self.cursor, "INSERT INTO stock_transactions (user_id, stock_symbol, transaction_type, quantity, price, date) VALUES %s", trades)
+        if expenses:
+            execute_values(self.cursor, "INSERT INTO expenses (user_id, name, category, amount, type, date) VALUES %s", expenses)
+
+    def _result(self, order, status, reason=""):
+        return {
+            "line": order.get("line"),
+            "user_id": order.get("user_id"),
+            "side": order.get("side"),
+            "symbol": order.get("symbol"),
+            "quantity": order.get("quantity"),
+            "price": order.get("price"),
+            "status": status,
+            "reason": reason,
+        }
+
+
+def write_results(path, results):
+    """Write per-order results to a CSV file."""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["line", "user_id", "side", "symbol", "quantity", "price", "status", "reason"])
+        writer.writeheader()
+        writer.writerows(sorted(results, key=lambda r: r["line"] or 0))
+
+
+def main():
+    init()
+    parser = argparse.ArgumentParser(description="Execute a file of buy/sell orders in bulk.")
+    parser.add_argument("orders", help="CSV file with user_id, side, symbol, quantity and optional price columns")
+    parser.add_argument("--results", default="order_results.csv", help="CSV file to write per-order results to")
+    parser.add_argument("--users-per-transaction", type=int, default=500)
+    parser.add_argument("--db-name", default="finance_tracker")
+    parser.add_argument("--db-user", default="postgres")
+    parser.add_argument("--password", default="your_password")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default="5432")
+    args = parser.parse_args()
+
+    db = DatabaseManager(db_name=args.db_name, user=args.db_user, password=args.password, host=args.host, port=args.port, setup=False)
+    try:
+        started = time.monotonic()
+        engine = OrderEngine(db.conn, users_per_transaction=args.users_per_transaction)
+        orders, results = engine.load_orders(args.orders)
+        results.extend(engine.execute(orders))
+        write_results(args.results, results)
+        filled = sum(1 for r in results if r["status"] == FILLED)
+        elapsed = time.monotonic() - started
+        print(f"{Fore.GREEN}{filled} orders filled{Style.RESET_ALL}, {Fore.RED}{len(results) - filled} rejected{Style.RESET_ALL} in {elapsed:.1f}s. Results written to {args.results}.")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
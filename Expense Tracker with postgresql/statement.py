@@ -0,0 +1,263 @@
+import argparse
+import os
+import time
+from calendar import monthrange
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date
+from tabulate import tabulate
+from colorama import init, Fore, Style
+import psycopg2
+from database import DatabaseManager
+from utils import format_currency
+
+_worker_db = None
+_worker_params = None
+
+
+def _init_worker(db_params):
+    """Open one database connection per worker process."""
+    global _worker_db, _worker_params
+    _worker_params = db_params
+    _worker_db = DatabaseManager(setup=False, **db_params)
+
+
+def _worker_connection():
+    """Return the worker's connection, reconnecting if the previous one was lost."""
+    global _worker_db
+    if _worker_db is None or _worker_db.conn.closed:
+        _worker_db = DatabaseManager(setup=False, **_worker_params)
+    return _worker_db
+
+
+def statement_path(out_dir, user_id):
+    """Return the output file used for a user's statement."""
+    return os.path.join(out_dir, f"user_{user_id}.txt")
+
+
+def parse_month(month):
+    """Return the first and last day of a MM-YYYY month."""
+    start = datetime.strptime(month, '%m-%Y').date()
+    end = date(start.year, start.month, monthrange(start.year, start.month)[1])
+    return start, end
+
+
+def holdings_as_of(cursor, user_id, as_of):
+    """Rebuild (symbol, quantity, avg buy price) holdings on a date by replaying stock_transactions.
+
+    Averages follow buy_stock/sell_stock: buys re-weight the average, sells leave it unchanged,
+    and a position sold down to zero starts afresh.
+    """
+    cursor.execute("""
+        SELECT stock_symbol, transaction_type, quantity, price
+        FROM stock_transactions
+        WHERE user_id=%s AND to_date(date, 'DD-MM-YYYY') <= %s
+        ORDER BY to_date(date, 'DD-MM-YYYY'), id
+    """, (user_id, as_of))
+    positions = {}
+    for symbol, trans_type, qty, price in cursor.fetchall():
+        qty, price = int(qty), float(price)
+        old_qty, old_avg = positions.get(symbol, (0, 0.0))
+        if trans_type == "BUY":
+            new_qty = old_qty + qty
+            positions[symbol] = (new_qty, ((old_qty * old_avg) + (qty * price)) / new_qty)
+        elif old_qty - qty > 0:
+            positions[symbol] = (old_qty - qty, old_avg)
+        else:
+            positions.pop(symbol, None)
+    return [(symbol, qty, avg) for symbol, (qty, avg) in sorted(positions.items())]
+
+
+def render_statement(cursor, user_id, month_start, month_end):
+    """Build the plain-text monthly statement for one user, or None if the user does not exist."""
+    cursor.execute("SELECT username, full_name, initial_balance FROM users WHERE id=%s", (user_id,))
+    user = cursor.fetchone()
+    if not user:
+        return None
+    username, full_name, initial_balance = user
+
+    cursor.execute("""
+        SELECT COALESCE(SUM(CASE WHEN type='income' THEN amount ELSE -amount END), 0)
+        FROM expenses
+        WHERE user_id=%s AND to_date(date, 'DD-MM-YYYY') < %s
+    """, (user_id, month_start))
+    opening_balance = float(initial_balance or 0) + float(cursor.fetchone()[0])
+
+    cursor.execute("""
+        SELECT id, date, name, category, amount, type
+        FROM expenses
+        WHERE user_id=%s AND to_date(date, 'DD-MM-YYYY') BETWEEN %s AND %s
+        ORDER BY to_date(date, 'DD-MM-YYYY'), id
+    """, (user_id, month_start, month_end))
+    transactions = cursor.fetchall()
+
+    holdings = holdings_as_of(cursor, user_id, month_end)
+
+    lines = [
+        f"Monthly Statement: {month_start.strftime('%m-%Y')}",
+        f"Account: {full_name} ({username})",
+        f"Opening Balance: {format_currency(opening_balance)}",
+        "",
+    ]
+
+    running_balance = opening_balance
+    totals = {}
+    table = []
+    for trans_id, trans_date, name, category, amount, trans_type in transactions:
+        amount = float(amount)
+        running_balance += amount if trans_type == 'income' else -amount
+        key = (category, trans_type)
+        totals[key] = totals.get(key, 0.0) + amount
+        table.append([
+            trans_id,
+            trans_date,
+            name,
+            category,
+            format_currency(amount) if trans_type == 'income' else "",
+            format_currency(amount) if trans_type == 'expense' else "",
+            format_currency(running_balance),
+        ])
+
+    lines.append("--- Transactions ---")
+    if table:
+        lines.append(tabulate(table, headers=["ID", "Date", "Description", "Category", "Income", "Expense", "Balance"], tablefmt="pretty"))
+    else:
+        lines.append("No transactions this month.")
+    lines.append("")
+
+    lines.append("--- Category Totals ---")
+    if totals:
+        category_rows = [[category, trans_type.capitalize(), format_currency(total)] for (category, trans_type), total in sorted(totals.items())]
+        lines.append(tabulate(category_rows, headers=["Category", "Type", "Total"], tablefmt="pretty"))
+    else:
+        lines.append("No category activity this month.")
+    lines.append("")
+
+    lines.append(f"--- Portfolio Snapshot as of {month_end.strftime('%d-%m-%Y')} (at cost) ---")
+    if holdings:
+        portfolio_rows = []
+        total_invested = 0.0
+        for symbol, qty, avg_price in holdings:
+            invested = int(qty) * float(avg_price)
+            total_invested += invested
+            portfolio_rows.append([symbol, int(qty), format_currency(float(avg_price)), format_currency(invested)])
+        lines.append(tabulate(portfolio_rows, headers=["Symbol", "Qty", "Avg Buy", "Invested (₹)"], tablefmt="pretty"))
+        lines.append(f"Total Invested: {format_currency(total_invested)}")
+    else:
+        lines.append("No holdings.")
+    lines.append("")
+
+    lines.append(f"Closing Balance: {format_currency(running_balance)}")
+    return "\n".join(lines) + "\n"
+
+
+def _generate_statement(task):
+    """Worker entry point: write one user's statement and return (user_id, error)."""
+    user_id, month_start, month_end, out_dir = task
+    try:
+        db = _worker_connection()
+        text = render_statement(db.cursor, user_id, month_start, month_end)
+        db.conn.rollback()  # Read-only: release the snapshot before the next user
+    except psycopg2.Error as e:
+        try:
+            _worker_db.conn.rollback()
+        except (psycopg2.Error, AttributeError):
+            pass  # Connection is gone; the next task reconnects
+        return user_id, str(e).strip()
+    if text is None:
+        return user_id, "user not found"
+
+    path = statement_path(out_dir, user_id)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)  # Statement files only appear once complete, which makes reruns resumable
+    except OSError as e:
+        return user_id, f"could not write statement: {e}"
+    return user_id, None
+
+
+def select_user_ids(cursor, user_ids=None, username_pattern=None):
+    """Return the IDs of all users, optionally filtered by ID list or username LIKE pattern."""
+    query = "SELECT id FROM users WHERE TRUE"
+    params = []
+    if user_ids:
+        query += " AND id = ANY(%s)"
+        params.append(list(user_ids))
+    if username_pattern:
+        query += " AND username LIKE %s"
+        params.append(username_pattern)
+    cursor.execute(query + " ORDER BY id", params)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def generate_statements(db_params, month, out_dir="statements", user_ids=None, username_pattern=None,
+                        workers=None, chunksize=32, report_every=5.0):
+    """Generate monthly statements for the selected users across a process pool."""
+    month_start, month_end = parse_month(month)
+    out_dir = os.path.join(out_dir, month_start.strftime('%Y-%m'))
+    os.makedirs(out_dir, exist_ok=True)
+
+    db = DatabaseManager(setup=False, **db_params)
+    try:
+        selected = select_user_ids(db.cursor, user_ids, username_pattern)
+    finally:
+        db.close()
+
+    pending = [uid for uid in selected if not os.path.exists(statement_path(out_dir, uid))]
+    skipped = len(selected) - len(pending)
+    print(f"{len(selected)} users selected, {skipped} already done, {len(pending)} to generate.")
+    if not pending:
+        return 0, 0
+
+    tasks = ((uid, month_start, month_end, out_dir) for uid in pending)
+    done, failed = 0, 0
+    started = last_report = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(db_params,)) as pool:
+        for user_id, error in pool.map(_generate_statement, tasks, chunksize=chunksize):
+            if error:
+                failed += 1
+                print(f"{Fore.RED}User {user_id}: {error}{Style.RESET_ALL}")
+            else:
+                done += 1
+            now = time.monotonic()
+            if now - last_report >= report_every:
+                last_report = now
+                rate = (done + failed) / (now - started)
+                print(f"{done + failed}/{len(pending)} processed ({rate:.1f} statements/s)")
+
+    elapsed = time.monotonic() - started
+    rate = (done + failed) / elapsed if elapsed else 0.0
+    color = Fore.GREEN if not failed else Fore.RED
+    print(f"{color}Generated {done} statements, {failed} failed in {elapsed:.1f}s ({rate:.1f} statements/s).{Style.RESET_ALL}")
+    return done, failed
+
+
+def main():
+    init()
+    parser = argparse.ArgumentParser(description="Generate monthly statements for all users.")
+    parser.add_argument("month", help="Statement month as MM-YYYY")
+    parser.add_argument("--out-dir", default="statements", help="Directory to write statements into")
+    parser.add_argument("--users", help="Comma-separated user IDs to include")
+    parser.add_argument("--username", help="Only include usernames matching this LIKE pattern")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunksize", type=int, default=32, help="Users handed to a worker at a time")
+    parser.add_argument("--db-name", default="finance_tracker")
+    parser.add_argument("--db-user", default="postgres")
+    parser.add_argument("--password", default="your_password")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default="5432")
+    args = parser.parse_args()
+
+    try:
+        parse_month(args.month)
+    except ValueError:
+        parser.error("month must be in MM-YYYY format (e.g., 08-2025)")
+
+    db_params = dict(db_name=args.db_name, user=args.db_user, password=args.password, host=args.host, port=args.port)
+    user_ids = [int(uid) for uid in args.users.split(",")] if args.users else None
+    generate_statements(db_params, args.month, args.out_dir, user_ids, args.username, args.workers, args.chunksize)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,120 @@
 from datetime import datetime
+from itertools import chain
 import yfinance as yf
 from tabulate import tabulate
-from utils import normalize_stock_symbol, get_valid_number, review_and_confirm, format_currency, confirm_action
+from utils import normalize_stock_symbol, get_valid_number, review_and_confirm, format_currency, confirm_action, stream_table, close_cursor, safe_rollback
 from colorama import Fore, Style
 import psycopg2
-from decimal import Decimal
+from expense import invalidate_pivot_cache, fetch_balance, lock_user
+from symbols import SymbolMaster
+
+try:
+    import readline
+except ImportError:  # Windows consoles have no readline; autocomplete falls back to '?' lookups
+    readline = None
+
+def fetch_quotes(symbols):
+    """Fetch the latest close for many symbols with a single download call."""
+    symbols = sorted(set(symbols))
+    if not symbols:
+        return {}
+    try:
+        data = yf.download(symbols, period="5d", auto_adjust=True, progress=False, threads=True)
+    except Exception as e:
+        print(f"{Fore.RED}Unable to fetch prices. Error: {e}{Style.RESET_ALL}")
+        return {}
+    if data is None or data.empty:
+        return {}
+    close = data["Close"]
+    if not hasattr(close, "columns"):  # Older yfinance returns a Series for a single ticker
+        close = close.to_frame(symbols[0])
+    quotes = {}
+    for symbol in symbols:
+        if symbol in close.columns:
+            series = close[symbol].dropna()
+            if not series.empty:
+                quotes[symbol] = round(float(series.iloc[-1]), 2)
+    return quotes
+
+def apply_buy(cursor, user_id, symbol, quantity, price, date):
+    """Record a buy in portfolio, stock_transactions and expenses; the caller commits.
+
+    Raises ValueError if the balance does not cover the purchase.
+    """
+    lock_user(cursor, user_id)
+    total = float(quantity * price)
+    balance = fetch_balance(cursor, user_id)
+    if total > balance:
+        raise ValueError(f"Insufficient funds. Need {format_currency(total)}, but balance is {format_currency(balance)}.")
+
+    cursor.execute("SELECT id, quantity, avg_buy_price FROM portfolio WHERE user_id=%s AND stock_symbol=%s", (user_id, symbol))
+    record = cursor.fetchone()
+
+    if record:
+        pid, old_qty, old_avg = record
+        old_qty = int(old_qty)
+        old_avg = float(old_avg)
+        new_qty = old_qty + quantity
+        new_avg = float(((old_qty * old_avg) + (quantity * price)) / new_qty)
+        cursor.execute("UPDATE portfolio SET quantity=%s, avg_buy_price=%s WHERE id=%s", (new_qty, new_avg, pid))
+    else:
+        cursor.execute("INSERT INTO portfolio (user_id, stock_symbol, quantity, avg_buy_price) VALUES (%s, %s, %s, %s)",
+                       (user_id, symbol, quantity, price))
+
+    cursor.execute("INSERT INTO stock_transactions (user_id, stock_symbol, transaction_type, quantity, price, date) VALUES (%s, %s, %s, %s, %s, %s)",
+                   (user_id, symbol, "BUY", quantity, price, date))
+
+    cursor.execute(
+        "INSERT INTO expenses (user_id, name, category, amount, type, date) VALUES (%s, %s, %s, %s, %s, %s)",
+        (user_id, f"Buy {symbol}", "Stock Purchase", total, "expense", date)
+    )
+
+def apply_sell(cursor, user_id, symbol, quantity, price, date):
+    """Record a sell in portfolio, stock_transactions and expenses; the caller commits.
+
+    Raises ValueError if the user does not hold enough shares.
+    """
+    lock_user(cursor, user_id)
+    cursor.execute("SELECT id, quantity FROM portfolio WHERE user_id=%s AND stock_symbol=%s", (user_id, symbol))
+    record = cursor.fetchone()
+    if not record:
+        raise ValueError(f"You do not own any shares of {symbol}.")
+
+    pid, old_qty = record
+    old_qty = int(old_qty)
+    if quantity > old_qty:
+        raise ValueError(f"You only have {old_qty} shares of {symbol}.")
+
+    new_qty = old_qty - quantity
+    if new_qty == 0:
+        cursor.execute("DELETE FROM portfolio WHERE id=%s", (pid,))
+    else:
+        cursor.execute("UPDATE portfolio SET quantity=%s WHERE id=%s", (new_qty, pid))
+
+    cursor.execute("INSERT INTO stock_transactions (user_id, stock_symbol, transaction_type, quantity, price, date) VALUES (%s, %s, %s, %s, %s, %s)",
+                   (user_id, symbol, "SELL", quantity, price, date))
+
+    cursor.execute(
+        "INSERT INTO expenses (user_id, name, category, amount, type, date) VALUES (%s, %s, %s, %s, %s, %s)",
+        (user_id, f"Sell {symbol}", "Stock Sale", float(quantity * price), "income", date)
+    )
+
+def fetch_holdings(cursor, user_id):
+    """Return a user's holdings as {symbol: quantity}, using the first portfolio row per symbol as buy/sell do."""
+    cursor.execute("SELECT stock_symbol, quantity FROM portfolio WHERE user_id=%s ORDER BY id", (user_id,))
+    holdings = {}
+    for symbol, qty in cursor.fetchall():
+        holdings.setdefault(symbol, int(qty))
+    return holdings
 
 class StockManager:
-    def __init__(self, db_conn):
+    def __init__(self, db_conn, journal=None):
         self.conn = db_conn
         self.cursor = db_conn.cursor()
+        self.journal = journal
+        self.symbols = SymbolMaster.load(download=True)
+        if not self.symbols.is_complete:
+            print(f"{Fore.YELLOW}Full NSE symbol list unavailable; unknown symbols will be checked online. Run 'python symbols.py refresh' to fetch it.{Style.RESET_ALL}")
         self.migrate_stock_transactions_dates()
 
     def get_live_price(self, symbol):
@@ -26,9 +131,10 @@ class StockManager:
             return None
 
     def buy_stock(self, user_id, symbol, quantity):
-        self.display_suggestions()
-        symbol = input("Enter NSE stock symbol (without .NS) [RELIANCE]: ").strip().upper()
-        symbol = 'RELIANCE' if not symbol else symbol
+        print("Tip: press Tab to complete a symbol, or end part of a symbol or company name with ? to search.")
+        symbol = self.prompt_symbol()
+        if symbol is None:
+            return
         quantity_input = get_valid_number("Enter quantity [1]: ", default=1, min_value=1)
         if quantity_input is None:
             return
@@ -43,6 +149,9 @@ class StockManager:
 
         total_cost = float(quantity * price)
         balance = self.get_balance(user_id)
+        if balance is None:
+            print(f"{Fore.RED}Balance is unavailable, so the buy cannot be checked. Try again later.{Style.RESET_ALL}")
+            return
         if total_cost > balance:
             print(f"{Fore.RED}Insufficient funds. Need {format_currency(total_cost)}, but balance is {format_currency(balance)}.{Style.RESET_ALL}")
             return
@@ -59,39 +168,28 @@ class StockManager:
         ):
             return
 
-        try:
-            self.cursor.execute("SELECT id, quantity, avg_buy_price FROM portfolio WHERE user_id=%s AND stock_symbol=%s", (user_id, symbol))
-            record = self.cursor.fetchone()
-
-            if record:
-                pid, old_qty, old_avg = record
-                old_qty = int(old_qty)
-                old_avg = float(old_avg)
-                new_qty = old_qty + quantity
-                new_avg = float(((old_qty * old_avg) + (quantity * price)) / new_qty)
-                self.cursor.execute("UPDATE portfolio SET quantity=%s, avg_buy_price=%s WHERE id=%s", (new_qty, new_avg, pid))
-            else:
-                self.cursor.execute("INSERT INTO portfolio (user_id, stock_symbol, quantity, avg_buy_price) VALUES (%s, %s, %s, %s)",
-                                  (user_id, symbol, quantity, price))
-
-            self.cursor.execute("INSERT INTO stock_transactions (user_id, stock_symbol, transaction_type, quantity, price, date) VALUES (%s, %s, %s, %s, %s, %s)",
-                              (user_id, symbol, "BUY", quantity, price, date))
-
-            self.cursor.execute(
-                "INSERT INTO expenses (user_id, name, category, amount, type, date) VALUES (%s, %s, %s, %s, %s, %s)",
-                (user_id, f"Buy {symbol}", "Stock Purchase", total_cost, "expense", date)
-            )
+        if self.journal:
+            self.journal.append(user_id, 'buy', balance_delta=-total_cost, holdings_delta={symbol: quantity}, symbol=symbol, quantity=quantity, price=price, date=date)
+            print(f"{Fore.GREEN}Buy of {quantity} shares of {symbol} queued and will sync in the background.{Style.RESET_ALL}")
+            return
 
+        try:
+            apply_buy(self.cursor, user_id, symbol, quantity, price, date)
             self.conn.commit()
+            invalidate_pivot_cache(user_id)
             print(f"{Fore.GREEN}Bought {quantity} shares of {symbol} at {format_currency(price)}.{Style.RESET_ALL}")
-        except psycopg2.Error as e:
+        except (psycopg2.Error, ValueError) as e:
             print(f"{Fore.RED}Error processing buy transaction: {e}{Style.RESET_ALL}")
-            self.conn.rollback()
+            safe_rollback(self.conn)
 
     def sell_stock(self, user_id, symbol, quantity):
         self.view_portfolio(user_id)
-        symbol = input("Enter NSE stock symbol (without .NS) [RELIANCE]: ").strip().upper()
-        symbol = 'RELIANCE' if not symbol else symbol
+        held = self.get_holdings(user_id)
+        if held is None:
+            return
+        symbol = self.prompt_symbol(held=held)
+        if symbol is None:
+            return
         quantity_input = get_valid_number("Enter quantity [1]: ", default=1, min_value=1)
         if quantity_input is None:
             return
@@ -109,15 +207,11 @@ class StockManager:
         symbol = normalize_stock_symbol(symbol)
 
         try:
-            self.cursor.execute("SELECT id, quantity, avg_buy_price FROM portfolio WHERE user_id=%s AND stock_symbol=%s", (user_id, symbol))
-            record = self.cursor.fetchone()
-
-            if not record:
+            if symbol not in held:
                 print(f"{Fore.RED}You do not own any shares of {symbol}.{Style.RESET_ALL}")
                 return
 
-            pid, old_qty, avg_price = record
-            old_qty = int(old_qty)
+            old_qty = held[symbol]
             if quantity > old_qty:
                 print(f"{Fore.RED}You only have {old_qty} shares of {symbol}.{Style.RESET_ALL}")
                 return
@@ -131,25 +225,18 @@ class StockManager:
             ):
                 return
 
-            new_qty = old_qty - quantity
-            if new_qty == 0:
-                self.cursor.execute("DELETE FROM portfolio WHERE id=%s", (pid,))
-            else:
-                self.cursor.execute("UPDATE portfolio SET quantity=%s WHERE id=%s", (new_qty, pid))
-
-            self.cursor.execute("INSERT INTO stock_transactions (user_id, stock_symbol, transaction_type, quantity, price, date) VALUES (%s, %s, %s, %s, %s, %s)",
-                              (user_id, symbol, "SELL", quantity, price, date))
-
-            self.cursor.execute(
-                "INSERT INTO expenses (user_id, name, category, amount, type, date) VALUES (%s, %s, %s, %s, %s, %s)",
-                (user_id, f"Sell {symbol}", "Stock Sale", total_gain, "income", date)
-            )
+            if self.journal:
+                self.journal.append(user_id, 'sell', balance_delta=total_gain, holdings_delta={symbol: -quantity}, symbol=symbol, quantity=quantity, price=price, date=date)
+                print(f"{Fore.GREEN}Sell of {quantity} shares of {symbol} queued and will sync in the background.{Style.RESET_ALL}")
+                return
 
+            apply_sell(self.cursor, user_id, symbol, quantity, price, date)
             self.conn.commit()
+            invalidate_pivot_cache(user_id)
             print(f"{Fore.GREEN}Sold {quantity} shares of {symbol} at {format_currency(price)}.{Style.RESET_ALL}")
-        except psycopg2.Error as e:
+        except (psycopg2.Error, ValueError) as e:
             print(f"{Fore.RED}Error processing sell transaction: {e}{Style.RESET_ALL}")
-            self.conn.rollback()
+            safe_rollback(self.conn)
 
     def view_portfolio(self, user_id):
         try:
@@ -159,63 +246,105 @@ class StockManager:
                 print(f"{Fore.RED}Your portfolio is empty.{Style.RESET_ALL}")
                 return
 
-            table = []
-            total_invested, total_current = 0, 0
-
-            for symbol, qty, avg_price in rows:
-                qty = int(qty)
-                avg_price = float(avg_price)
-                live_price = self.get_live_price(symbol) or 0
-                live_price = float(live_price)
-                invested = qty * avg_price
-                current = qty * live_price
-                profit = current - invested
-                profit_pct = (profit / invested * 100) if invested else 0
-                live_price_str = f"{Fore.BLUE}{format_currency(live_price)}{Style.RESET_ALL}" if live_price else "0.00"
-                profit_str = f"{Fore.GREEN}{format_currency(profit)}{Style.RESET_ALL}" if profit >= 0 else f"{Fore.RED}{format_currency(profit)}{Style.RESET_ALL}"
-                profit_pct_str = f"{Fore.GREEN}{profit_pct:.2f}%{Style.RESET_ALL}" if profit_pct >= 0 else f"{Fore.RED}{profit_pct:.2f}%{Style.RESET_ALL}"
-                table.append([symbol, qty, format_currency(avg_price), live_price_str, format_currency(invested), format_currency(current), profit_str, profit_pct_str])
-                total_invested += invested
-                total_current += current
+            quotes = fetch_quotes(symbol for symbol, _, _ in rows)
+            # Totals come from all rows up front, so they stay correct if the pager is quit early
+            total_invested = sum(int(qty) * float(avg_price) for _, qty, avg_price in rows)
+            total_current = sum(int(qty) * quotes.get(symbol, 0.0) for symbol, qty, _ in rows)
+
+            def table_rows():
+                for symbol, qty, avg_price in rows:
+                    qty = int(qty)
+                    avg_price = float(avg_price)
+                    live_price = quotes.get(symbol, 0.0)
+                    invested = qty * avg_price
+                    current = qty * live_price
+                    profit = current - invested
+                    profit_pct = (profit / invested * 100) if invested else 0
+                    pl_color = Fore.GREEN if profit >= 0 else Fore.RED
+                    yield [
+                        symbol,
+                        qty,
+                        format_currency(avg_price),
+                        (format_currency(live_price), Fore.BLUE) if live_price else "0.00",
+                        format_currency(invested),
+                        format_currency(current),
+                        (format_currency(profit), pl_color),
+                        (f"{profit_pct:.2f}%", Fore.GREEN if profit_pct >= 0 else Fore.RED),
+                    ]
 
             print("\n--- Portfolio Summary ---")
-            print(tabulate(table, headers=["Symbol", "Qty", "Avg Buy", "Live Price", "Invested (₹)", "Current (₹)", "P/L (₹)", "P/L %"], tablefmt="pretty"))
+            stream_table(["Symbol", "Qty", "Avg Buy", "Live Price", "Invested (₹)", "Current (₹)", "P/L (₹)", "P/L %"], table_rows(), align="<>>>>>>>")
             total_pl = total_current - total_invested
             total_pl_pct = ((total_current - total_invested) / total_invested * 100) if total_invested else 0
             pl_color = Fore.GREEN if total_pl >= 0 else Fore.RED
             print(f"\nTotal Invested: {format_currency(total_invested)} | Current Value: {format_currency(total_current)} | P/L: {pl_color}{format_currency(total_pl)} ({total_pl_pct:.2f}%){Style.RESET_ALL}")
         except psycopg2.Error as e:
             print(f"{Fore.RED}Error fetching portfolio: {e}{Style.RESET_ALL}")
-            self.conn.rollback()
+            safe_rollback(self.conn)
 
     def view_stock_transactions(self, user_id):
+        cursor = None
         try:
-            self.cursor.execute("SELECT stock_symbol, transaction_type, quantity, price, date FROM stock_transactions WHERE user_id=%s ORDER BY to_date(date, 'DD-MM-YYYY') DESC", (user_id,))
-            rows = self.cursor.fetchall()
-            if not rows:
+            # Server-side cursor: rows are fetched in batches while printing instead of all at once
+            cursor = self.conn.cursor(name="view_stock_transactions")
+            cursor.itersize = 2000
+            cursor.execute("SELECT stock_symbol, transaction_type, quantity, price, date FROM stock_transactions WHERE user_id=%s ORDER BY to_date(date, 'DD-MM-YYYY') DESC", (user_id,))
+            first = cursor.fetchone()
+            if first is None:
                 print(f"{Fore.RED}No stock transactions found.{Style.RESET_ALL}")
                 return
 
-            formatted_rows = []
-            for row in rows:
-                symbol, trans_type, qty, price, date = row
-                formatted_rows.append([symbol, trans_type, qty, format_currency(float(price)), date])
-
+            rows = (
+                [symbol, trans_type, qty, format_currency(float(price)), date]
+                for symbol, trans_type, qty, price, date in chain([first], cursor)
+            )
             print("\n--- Stock Transaction History ---")
-            print(tabulate(formatted_rows, headers=["Symbol", "Type", "Qty", "Price", "Date"], tablefmt="pretty"))
+            stream_table(["Symbol", "Type", "Qty", "Price", "Date"], rows, align="<<>><")
         except psycopg2.Error as e:
             print(f"{Fore.RED}Error fetching transactions: {e}{Style.RESET_ALL}")
-            self.conn.rollback()
-
-    def display_suggestions(self):
-        suggestions = [
-            ["RELIANCE.NS", "Reliance Industries", 15.0],
-            ["TCS.NS", "Tata Consultancy Services", 12.0],
-            ["HDFCBANK.NS", "HDFC Bank", 14.0]
-        ]
-        print("\n--- Suggested Nifty 50 Stocks to Buy ---")
-        print(tabulate(suggestions, headers=["Symbol", "Company Name", "Est. Annual Return (%)"], tablefmt="pretty"))
-        print("Note: Estimated returns are based on historical trends and not guaranteed. Use 'Buy Stock' to invest.")
+            safe_rollback(self.conn)
+        finally:
+            close_cursor(cursor)
+
+    def prompt_symbol(self, default="RELIANCE", held=()):
+        """Prompt for an NSE symbol with Tab completion and '?' lookup, validated against the symbol master.
+
+        Symbols in `held` (already in the user's portfolio) are accepted even if the master does not list them.
+        """
+        completer_state = None
+        if readline and self.symbols.is_loaded():
+            completer_state = (readline.get_completer(), readline.get_completer_delims())
+            readline.set_completer(lambda text, state: (self.symbols.complete(text, limit=50) + [None])[state])
+            readline.set_completer_delims(" ")
+            readline.parse_and_bind("tab: complete")
+        try:
+            while True:
+                text = input(f"Enter NSE stock symbol (without .NS, add ? to search) [{default}]: ").strip()
+                if text.endswith("?"):
+                    self.show_symbol_matches(text[:-1])
+                    continue
+                symbol = text.upper() or default
+                if self.symbols.is_listed(symbol) or normalize_stock_symbol(symbol) in held:
+                    return symbol
+                if self.symbols.is_valid(symbol):
+                    print(f"{Fore.YELLOW}{symbol} is not in the local symbol list; it will be checked online. Run 'python symbols.py refresh' for the full NSE list.{Style.RESET_ALL}")
+                    return symbol
+                print(f"{Fore.RED}{symbol} is not a listed NSE symbol.{Style.RESET_ALL}")
+                if not self.show_symbol_matches(symbol):
+                    return None
+        finally:
+            if completer_state:
+                readline.set_completer(completer_state[0])
+                readline.set_completer_delims(completer_state[1])
+
+    def show_symbol_matches(self, text):
+        """Print symbols matching a symbol prefix or company name; return True if any matched."""
+        matches = self.symbols.search(text)
+        if not matches:
+            print(f"{Fore.RED}No symbols match '{text}'.{Style.RESET_ALL}")
+            return False
+        print(tabulate(matches, headers=["Symbol", "Company Name", "Series"], tablefmt="pretty"))
+        return True
 
     def migrate_stock_transactions_dates(self):
         try:
@@ -231,21 +360,29 @@ class StockManager:
             self.conn.commit()
         except psycopg2.Error as e:
             print(f"{Fore.RED}Error migrating dates: {e}{Style.RESET_ALL}")
-            self.conn.rollback()
+            safe_rollback(self.conn)
 
     def get_balance(self, user_id):
+        """Return the user's balance, including queued journal writes; None if it cannot be read."""
         try:
-            self.cursor.execute("SELECT initial_balance FROM users WHERE id=%s", (user_id,))
-            initial_balance = self.cursor.fetchone()[0] or Decimal('0.0')
-            self.cursor.execute("SELECT SUM(amount) FROM expenses WHERE user_id=%s AND type='income'", (user_id,))
-            income = self.cursor.fetchone()[0] or Decimal('0.0')
-            self.cursor.execute("SELECT SUM(amount) FROM expenses WHERE user_id=%s AND type='expense'", (user_id,))
-            expense = self.cursor.fetchone()[0] or Decimal('0.0')
-            return float(initial_balance) + float(income) - float(expense)
+            if self.journal:
+                return self.journal.projected_balance(user_id, lambda: fetch_balance(self.cursor, user_id))
+            return fetch_balance(self.cursor, user_id)
         except psycopg2.Error as e:
             print(f"{Fore.RED}Error calculating balance: {e}{Style.RESET_ALL}")
-            self.conn.rollback()
-            return 0.0
+            safe_rollback(self.conn)
+            return None
+
+    def get_holdings(self, user_id):
+        """Return {symbol: quantity}, including queued journal trades; None if it cannot be read."""
+        try:
+            if self.journal:
+                return self.journal.projected_holdings(user_id, lambda: fetch_holdings(self.cursor, user_id))
+            return fetch_holdings(self.cursor, user_id)
+        except psycopg2.Error as e:
+            print(f"{Fore.RED}Error fetching portfolio: {e}{Style.RESET_ALL}")
+            safe_rollback(self.conn)
+            return None
 
     def stock_menu(self, user_id, full_name):
         while True:
@@ -254,7 +391,7 @@ class StockManager:
             print("2. Sell Stock")
             print("3. View Stock Portfolio")
             print("4. View Stock Transactions")
-            print("5. View Suggested Stocks")
+            print("5. Search NSE Symbols")
             print("6. Back")
             sub_choice = input("Choose an option: ").strip()
 
@@ -267,7 +404,7 @@ class StockManager:
             elif sub_choice == '4':
                 self.view_stock_transactions(user_id)
             elif sub_choice == '5':
-                self.display_suggestions()
+                self.show_symbol_matches(input("Enter part of a symbol or company name: ").strip())
             elif sub_choice == '6':
                 if confirm_action("back to the home menu?", "Cancelled. Returning to stock menu."):
                     print(f"{Fore.GREEN}Returning to home menu.{Style.RESET_ALL}")
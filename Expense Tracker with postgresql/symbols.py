@@ -0,0 +1,177 @@
+import argparse
+import csv
+import os
+import re
+import time
+import urllib.request
+from bisect import bisect_left
+from typing import List, Optional, Tuple
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+# Bundled Nifty 50 list: enough for autocomplete, but not every listed stock
+BUNDLED_SYMBOL_FILE = os.path.join(_HERE, "nse_symbols.csv")
+# Full NSE equity list written by `python symbols.py refresh`
+FULL_SYMBOL_FILE = os.path.join(_HERE, "nse_equity_list.csv")
+NSE_EQUITY_LIST_URL = "https://archives.nseindia.com/content/equity/EQUITY_L.csv"
+# After a failed download, wait this long before trying again so offline starts stay fast
+DOWNLOAD_RETRY_SECONDS = 24 * 60 * 60
+
+
+def _base_symbol(symbol: str) -> str:
+    """Uppercase a symbol and strip any .NS suffix."""
+    symbol = symbol.strip().upper()
+    return symbol[:-3] if symbol.endswith(".NS") else symbol
+
+
+class SymbolMaster:
+    """In-memory NSE symbol list with prefix and company-name lookup.
+
+    Loads the NSE equity list format (SYMBOL, NAME OF COMPANY, SERIES columns;
+    any extra columns are ignored). Only a `complete` master can rule a symbol
+    out (`is_complete`); with the partial bundled list, unknown symbols are left to the price lookup.
+    """
+
+    def __init__(self, rows=(), complete=False):
+        entries = sorted({_base_symbol(symbol): (name, series) for symbol, name, series in rows if symbol.strip()}.items())
+        self.symbols = [symbol for symbol, _ in entries]
+        self.is_complete = complete and bool(self.symbols)
+        self.details = [details for _, details in entries]
+        # (lowercase name word, symbol index) pairs, sorted for prefix search on company names
+        self.name_words = sorted(
+            (word, idx)
+            for idx, (name, _) in enumerate(self.details)
+            for word in set(re.findall(r"[a-z0-9&]+", name.lower()))
+        )
+
+    @classmethod
+    def load(cls, path: Optional[str] = None, complete: Optional[bool] = None, download: bool = False) -> "SymbolMaster":
+        """Load a symbol master from a CSV file; an empty master is returned if the file is missing.
+
+        Without a path, the full list from `refresh_symbol_file` is used when present (fetched
+        first if `download` is set), otherwise the bundled partial list. An explicit path is
+        treated as a complete list unless told otherwise.
+        """
+        if path is None and download:
+            ensure_symbol_file()
+        if path is None:
+            path = FULL_SYMBOL_FILE if os.path.exists(FULL_SYMBOL_FILE) else BUNDLED_SYMBOL_FILE
+        if complete is None:
+            complete = path != BUNDLED_SYMBOL_FILE
+        if not os.path.exists(path):
+            return cls()
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            header = [column.strip().upper() for column in next(reader, [])]
+            try:
+                symbol_col = header.index("SYMBOL")
+                name_col = header.index("NAME OF COMPANY")
+            except ValueError:
+                raise ValueError(f"{path} must have SYMBOL and NAME OF COMPANY columns")
+            series_col = header.index("SERIES") if "SERIES" in header else None
+            rows = (
+                (row[symbol_col], row[name_col].strip(), row[series_col].strip() if series_col is not None else "")
+                for row in reader if len(row) > max(symbol_col, name_col)
+            )
+            return cls(rows, complete=complete)
+
+    def is_loaded(self) -> bool:
+        return bool(self.symbols)
+
+    def is_listed(self, symbol: str) -> bool:
+        """Return True if the symbol is in the loaded list."""
+        return self.lookup(symbol) is not None
+
+    def is_valid(self, symbol: str) -> bool:
+        """Return False only when a complete symbol master shows the symbol does not exist."""
+        if not self.is_complete:
+            return True
+        return self.is_listed(symbol)
+
+    def lookup(self, symbol: str) -> Optional[Tuple[str, str, str]]:
+        """Return (symbol, company name, series) for an exact symbol match."""
+        symbol = _base_symbol(symbol)
+        idx = bisect_left(self.symbols, symbol)
+        if idx < len(self.symbols) and self.symbols[idx] == symbol:
+            return (symbol,) + self.details[idx]
+        return None
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """Return symbols starting with the given prefix."""
+        prefix = _base_symbol(prefix)
+        matches = []
+        idx = bisect_left(self.symbols, prefix)
+        while idx < len(self.symbols) and self.symbols[idx].startswith(prefix) and len(matches) < limit:
+            matches.append(self.symbols[idx])
+            idx += 1
+        return matches
+
+    def search(self, text: str, limit: int = 10) -> List[Tuple[str, str, str]]:
+        """Return (symbol, company name, series) entries matching a symbol prefix or company-name word prefix."""
+        text = text.strip()
+        if not text:
+            return []
+        indices = [bisect_left(self.symbols, symbol) for symbol in self.complete(text, limit)]
+        words = re.findall(r"[a-z0-9&]+", text.lower())
+        if not words:
+            return [(self.symbols[idx],) + self.details[idx] for idx in indices]
+        first, rest = words[0], words[1:]
+        pos = bisect_left(self.name_words, (first, -1))
+        while pos < len(self.name_words) and self.name_words[pos][0].startswith(first) and len(indices) < limit:
+            idx = self.name_words[pos][1]
+            name_words = self.details[idx][0].lower().split()
+            if idx not in indices and all(any(w.startswith(r) for w in name_words) for r in rest):
+                indices.append(idx)
+            pos += 1
+        return [(self.symbols[idx],) + self.details[idx] for idx in indices]
+
+
+def refresh_symbol_file(url: str = NSE_EQUITY_LIST_URL, path: str = FULL_SYMBOL_FILE, timeout: float = 30) -> int:
+    """Download the full NSE equity list, replace the local copy and return the number of symbols."""
+    request = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})  # NSE rejects requests without one
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        data = response.read()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    try:
+        count = len(SymbolMaster.load(tmp_path).symbols)
+    except (ValueError, UnicodeDecodeError):
+        os.remove(tmp_path)
+        raise ValueError(f"{url} did not return an NSE equity list")
+    os.replace(tmp_path, path)
+    return count
+
+
+def ensure_symbol_file(path: str = FULL_SYMBOL_FILE, timeout: float = 10) -> bool:
+    """Download the full NSE equity list if there is no local copy yet; return True if one is available.
+
+    A failed attempt is remembered in `<path>.failed` and not retried for DOWNLOAD_RETRY_SECONDS.
+    """
+    if os.path.exists(path):
+        return True
+    marker = path + ".failed"
+    if os.path.exists(marker) and time.time() - os.path.getmtime(marker) < DOWNLOAD_RETRY_SECONDS:
+        return False
+    try:
+        refresh_symbol_file(path=path, timeout=timeout)
+    except (OSError, ValueError):  # Offline, blocked or not an equity list
+        with open(marker, "w"):
+            pass
+        return False
+    if os.path.exists(marker):
+        os.remove(marker)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local NSE symbol master.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    refresh = commands.add_parser("refresh", help="Download the full NSE equity list")
+    refresh.add_argument("--url", default=NSE_EQUITY_LIST_URL)
+    args = parser.parse_args()
+    if args.command == "refresh":
+        print(f"Saved {refresh_symbol_file(args.url)} symbols to {FULL_SYMBOL_FILE}.")
+
+
+if __name__ == "__main__":
+    main()
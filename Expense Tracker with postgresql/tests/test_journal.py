@@ -0,0 +1,279 @@
+import json
+import os
+
+import psycopg2
+import pytest
+
+import journal
+from journal import WriteJournal, JournalLockedError
+
+
+class FakeDB:
+    """Committed state shared by every FakeConn: applied entry IDs and the rows replayers wrote."""
+
+    def __init__(self):
+        self.applied = {}
+        self.rows = []
+        self.connects = 0
+
+    def connect(self):
+        self.connects += 1
+        return FakeConn(self)
+
+
+class FakeConn:
+    def __init__(self, db):
+        self.db = db
+        self.closed = False
+        self.applied = {}
+        self.rows = []
+        self.savepoint = None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.db.applied.update(self.applied)
+        self.db.rows.extend(self.rows)
+        self.rollback()
+
+    def rollback(self):
+        self.applied, self.rows, self.savepoint = {}, [], None
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.connection = conn
+        self.closed = False
+        self.rowcount = -1
+
+    def execute(self, query, params=()):
+        conn = self.connection
+        if query == "SAVEPOINT journal_entry":
+            conn.savepoint = (dict(conn.applied), list(conn.rows))
+        elif query == "ROLLBACK TO SAVEPOINT journal_entry":
+            conn.applied, conn.rows = dict(conn.savepoint[0]), list(conn.savepoint[1])
+        elif query.startswith("INSERT INTO journal_applied"):
+            entry_id = params[0]
+            if entry_id in conn.db.applied or entry_id in conn.applied:
+                self.rowcount = 0
+            else:
+                conn.applied[entry_id] = 'conflict' if "'conflict'" in query else 'applied'
+                self.rowcount = 1
+
+    def close(self):
+        self.closed = True
+
+
+def record(cursor, user_id, amount, fail=False):
+    if fail:
+        raise ValueError("Insufficient funds.")
+    cursor.connection.rows.append((user_id, amount))
+
+
+def link_down(cursor, user_id, amount):
+    raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+@pytest.fixture(autouse=True)
+def fake_replayers(monkeypatch):
+    monkeypatch.setitem(journal.REPLAYERS, 'add_expense', record)
+    # Tests drive replay() themselves; the background flusher would race them
+    monkeypatch.setattr(WriteJournal, "_flush_loop", lambda self: None)
+
+
+@pytest.fixture
+def db():
+    return FakeDB()
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "journal.jsonl")
+
+
+def open_journal(path, db, **kwargs):
+    return WriteJournal(path, connect=db.connect, **kwargs)
+
+
+def crash(j):
+    """Stop a journal the way a killed process would: no final sync or replay."""
+    j._stop.set()
+    j._syncer.join()
+    j._file.close()
+
+
+def test_replay_applies_entries_in_order_and_compacts(path, db):
+    j = open_journal(path, db)
+    j.append(1, 'add_expense', balance_delta=10.0, amount=10)
+    j.append(2, 'add_expense', balance_delta=20.0, amount=20)
+    j.append(1, 'add_expense', balance_delta=-5.0, amount=-5)
+
+    assert j.replay() == 3
+    assert db.rows == [(1, 10), (2, 20), (1, -5)]
+    assert j._offset == os.path.getsize(path)
+    assert j.pending_bytes() == 0
+
+    assert j.replay() == 0  # Nothing left: the journal is truncated and the offset reset
+    assert os.path.getsize(path) == 0
+    assert j._offset == 0
+    with open(path + ".offset") as f:
+        assert f.read() == "0"
+    crash(j)
+
+
+def test_replay_respects_batch_size(path, db):
+    j = open_journal(path, db, batch_size=2)
+    for amount in range(3):
+        j.append(1, 'add_expense', amount=amount)
+
+    assert j.replay() == 2
+    assert db.rows == [(1, 0), (1, 1)]
+    assert j.replay() == 1
+    assert db.rows == [(1, 0), (1, 1), (1, 2)]
+    crash(j)
+
+
+def test_read_batch_stops_at_partial_line(path, db):
+    j = open_journal(path, db)
+    j.append(1, 'add_expense', amount=1)
+    complete = os.path.getsize(path)
+    tail = json.dumps({'id': 'b' * 32, 'user_id': 1, 'op': 'add_expense', 'args': {'amount': 2}}) + "\n"
+    with open(path, "a") as f:  # A writer interrupted mid-line
+        f.write(tail[:15])
+
+    batch = j._read_batch()
+    assert [entry['args'] for entry, _ in batch] == [{'amount': 1}]
+    assert batch[-1][1]['end'] == complete
+
+    assert j.replay() == 1
+    assert j._offset == complete
+    assert j.replay() == 0
+    assert os.path.getsize(path) > complete  # Not compacted while a partial line remains
+
+    with open(path, "a") as f:
+        f.write(tail[15:])
+    assert j.replay() == 1
+    assert db.rows == [(1, 1), (1, 2)]
+    crash(j)
+
+
+def test_malformed_lines_are_recorded_as_unreadable(path, db):
+    with open(path, "w") as f:
+        f.write("not json\n")
+        f.write(json.dumps({'id': 1, 'op': 'add_expense'}) + "\n")
+    j = open_journal(path, db)
+
+    assert j.replay() == 2
+    assert db.rows == []
+    with open(path + ".conflicts") as f:
+        conflicts = [json.loads(line) for line in f]
+    assert [c['reason'] for c in conflicts] == ["Unreadable journal entry."] * 2
+    assert conflicts[0]['raw'] == "not json"
+    assert j._unreported == {}  # No user to report them to
+    crash(j)
+
+
+def test_settle_folds_applied_entries_into_base(path, db):
+    j = open_journal(path, db)
+    j.append(1, 'add_expense', balance_delta=50.0, amount=50)
+    j.append(1, 'add_expense', balance_delta=-30.0, amount=-30, fail=True)
+    assert j.projected_balance(1, lambda: 100.0) == 120.0
+
+    j.replay()
+
+    def offline():
+        raise AssertionError("base should not be re-read")
+    # The applied entry moved into the base; the rejected one no longer counts
+    assert j.projected_balance(1, offline) == 150.0
+    assert j._pending == {}
+    crash(j)
+
+
+def test_crash_between_commit_and_saving_offset_does_not_replay_twice(path, db, monkeypatch):
+    j = open_journal(path, db)
+    j.append(1, 'add_expense', balance_delta=10.0, amount=10)
+    j.append(1, 'add_expense', balance_delta=20.0, amount=20)
+
+    def killed(offset):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(j, "_save_offset", killed)
+    with pytest.raises(KeyboardInterrupt):
+        j.replay()
+    assert db.rows == [(1, 10), (1, 20)]  # Committed, but the offset still points at the start
+    crash(j)
+
+    restarted = open_journal(path, db)
+    assert restarted._offset == 0
+    assert len(restarted._pending) == 2
+    assert restarted.replay() == 2
+    assert db.rows == [(1, 10), (1, 20)]
+    assert restarted._pending == {}
+    # The base read before the replay may already include these entries, so it is re-read
+    assert restarted.projected_balance(1, lambda: 130.0) == 130.0
+    crash(restarted)
+
+
+def test_conflicts_are_kept_per_user(path, db):
+    j = open_journal(path, db)
+    j.append(1, 'add_expense', amount=500, fail=True)
+    j.append(2, 'add_expense', amount=5)
+    j.append(3, 'add_expense', amount=700, fail=True)
+
+    assert j.replay() == 3
+    assert db.rows == [(2, 5)]
+    assert sorted(db.applied.values()) == ['applied', 'conflict', 'conflict']
+    assert j.take_conflicts(2) == []
+    crash(j)
+
+    restarted = open_journal(path, db)  # Unreported conflicts survive a restart
+    [conflict] = restarted.take_conflicts(1)
+    assert conflict['user_id'] == 1 and conflict['reason'] == "Insufficient funds."
+    assert restarted.take_conflicts(1) == []
+    assert [c['user_id'] for c in restarted.take_conflicts(3)] == [3]
+    crash(restarted)
+
+
+def test_link_error_keeps_entries_for_retry(path, db, monkeypatch):
+    j = open_journal(path, db)
+    j.append(1, 'add_expense', balance_delta=10.0, amount=10)
+    monkeypatch.setitem(journal.REPLAYERS, 'add_expense', link_down)
+
+    with pytest.raises(psycopg2.OperationalError):
+        j.replay()
+    assert j._offset == 0
+    assert j._conn is None
+    assert len(j._pending) == 1
+    assert db.applied == {}
+
+    monkeypatch.setitem(journal.REPLAYERS, 'add_expense', record)
+    assert j.replay() == 1
+    assert db.rows == [(1, 10)]
+    assert db.connects == 2
+    crash(j)
+
+
+def test_close_replays_at_most_one_batch(path, db, capsys):
+    j = open_journal(path, db, batch_size=2)
+    for amount in range(5):
+        j.append(1, 'add_expense', balance_delta=1.0, amount=amount)
+
+    j.close()
+    assert db.rows == [(1, 0), (1, 1)]
+    assert "queued writes will sync next session" in capsys.readouterr().out
+
+    restarted = open_journal(path, db, batch_size=2)
+    assert len(restarted._pending) == 3
+    assert restarted.projected_balance(1, lambda: 2.0) == 5.0
+    crash(restarted)
+
+
+@pytest.mark.skipif(journal.fcntl is None, reason="no advisory file locks on this platform")
+def test_second_instance_is_refused(path, db):
+    j = open_journal(path, db)
+    with pytest.raises(JournalLockedError):
+        open_journal(path, db)
+    crash(j)
@@ -1,6 +1,6 @@
 import psycopg2
 from getpass import getpass
-from utils import get_valid_number, confirm_action
+from utils import get_valid_number, confirm_action, safe_rollback
 from colorama import Fore, Style
 
 class UserManager:
@@ -40,7 +40,10 @@ class UserManager:
             print(f"{Fore.GREEN}Registration successful. You can now log in.{Style.RESET_ALL}")
         except psycopg2.IntegrityError as e:
             print(f"{Fore.RED}Username already taken. Choose a different one.{Style.RESET_ALL}")
-            self.conn.rollback()
+            safe_rollback(self.conn)
+        except psycopg2.Error as e:
+            print(f"{Fore.RED}Error during registration: {e}{Style.RESET_ALL}")
+            safe_rollback(self.conn)
 
     def login(self):
         """Login and return user ID and full name."""
@@ -57,5 +60,5 @@ class UserManager:
                 return None, None
         except psycopg2.Error as e:
             print(f"{Fore.RED}Error during login: {e}{Style.RESET_ALL}")
-            self.conn.rollback()
+            safe_rollback(self.conn)
             return None, None
\ No newline at end of file
@@ -1,8 +1,19 @@
+import os
+import shlex
+import subprocess
+import sys
 from datetime import datetime
-from typing import List, Optional
+from itertools import chain, islice
+from typing import Iterable, List, Optional, Sequence
 from tabulate import tabulate
 from colorama import Fore, Style
 
+# Set NO_COLOR to print large tables without ANSI colours (faster, and safe for piping to files)
+PLAIN_OUTPUT = bool(os.environ.get("NO_COLOR"))
+
+INCOME_CATEGORIES = ['Salary', 'Bonus', 'Interest', 'Gift', 'Stock Sale', 'Other Income']
+EXPENSE_CATEGORIES = ['Food', 'Rent', 'Transport', 'Bills', 'Shopping', 'Stock Purchase', 'Other Expense']
+
 def validate_date(date_str):
     """Validate date format (DD-MM-YYYY)."""
     try:
@@ -40,11 +51,7 @@ def get_valid_number(prompt: str, default: Optional[float] = None, min_value: fl
 
 def select_category(exp_type: str, default_category: Optional[str] = None) -> Optional[str]:
     """Prompt user to select a category for a transaction."""
-    categories = (
-        ['Salary', 'Bonus', 'Interest', 'Gift', 'Stock Sale', 'Other Income']
-        if exp_type == 'income'
-        else ['Food', 'Rent', 'Transport', 'Bills', 'Shopping', 'Stock Purchase', 'Other Expense']
-    )
+    categories = INCOME_CATEGORIES if exp_type == 'income' else EXPENSE_CATEGORIES
     print(f"\nSelect {'Income' if exp_type == 'income' else 'Expense'} Category:")
     for idx, cat in enumerate(categories, 1):
         print(f"{idx}. {cat}")
@@ -71,4 +78,96 @@ def review_and_confirm(title: str, headers: List[str], data: List, confirm_messa
 
 def normalize_stock_symbol(symbol: str) -> str:
     """Normalize stock symbol to uppercase and append .NS if not present."""
-    return symbol.upper() + ".NS" if not symbol.endswith(".NS") else symbol.upper()
\ No newline at end of file
+    return symbol.upper() + ".NS" if not symbol.endswith(".NS") else symbol.upper()
+
+def close_cursor(cursor) -> None:
+    """Close a (possibly server-side) cursor, ignoring errors from an already aborted transaction."""
+    if cursor is None or cursor.closed:
+        return
+    try:
+        cursor.close()
+    except Exception:
+        pass
+
+def safe_rollback(conn) -> None:
+    """Roll back after a failed statement without raising if the connection itself was lost."""
+    try:
+        conn.rollback()
+    except Exception:
+        pass
+
+def _cell_text(cell):
+    return str(cell[0] if isinstance(cell, tuple) else cell)
+
+def stream_table(headers: Sequence[str], rows: Iterable, widths: Optional[Sequence[Optional[int]]] = None, align: Optional[str] = None,
+                 truncate: Sequence[int] = (), sample_size: int = 200, max_width: int = 40, color: Optional[bool] = None,
+                 pager: Optional[bool] = None) -> int:
+    """Print a table row by row as rows arrive and return the number of rows printed.
+
+    Unlike tabulate, the whole table is never held in memory: column widths come from `widths`
+    (None entries are measured) or from the first `sample_size` rows. Only the free-text columns
+    listed in `truncate` are capped at `max_width` and cut with "…"; any other column widens
+    when a later value does not fit, so IDs and amounts are never cut. A cell is either a plain
+    value or a (value, colour) tuple; colour codes are never measured. `align` holds one '<' or
+    '>' per column. With pager=None the output goes through $PAGER (default `less -RFX`, which
+    leaves the table on screen) when stdout is a terminal and the table is longer than the sample.
+    """
+    rows = iter(rows)
+    sample = list(islice(rows, sample_size))
+    widths = list(widths or [None] * len(headers))
+    for i, header in enumerate(headers):
+        if widths[i] is None:
+            widths[i] = max([len(header)] + [len(_cell_text(row[i])) for row in sample])
+            if i in truncate:
+                widths[i] = min(widths[i], max_width)
+    align = align or "<" * len(headers)
+    color = not PLAIN_OUTPUT if color is None else color
+    if pager is None:
+        pager = len(sample) == sample_size and sys.stdout.isatty()
+
+    def format_row(row):
+        parts = []
+        for i, (cell, side) in enumerate(zip(row, align)):
+            text = _cell_text(cell)
+            if len(text) > widths[i]:
+                if i in truncate:
+                    text = text[:widths[i] - 1] + "…"
+                else:
+                    widths[i] = len(text)  # Later rows and the closing border use the new width
+            text = f"{text:{side}{widths[i]}}"
+            if color and isinstance(cell, tuple) and cell[1]:
+                text = f"{cell[1]}{text}{Style.RESET_ALL}"
+            parts.append(text)
+        return "| " + " | ".join(parts) + " |\n"
+
+    def border():
+        return "+" + "+".join("-" * (w + 2) for w in widths) + "+\n"
+
+    proc = None
+    out = sys.stdout
+    if pager:
+        try:
+            proc = subprocess.Popen(shlex.split(os.environ.get("PAGER", "less -RFX")), stdin=subprocess.PIPE, text=True, encoding="utf-8")
+            out = proc.stdin
+        except OSError:
+            proc = None
+
+    count = 0
+    try:
+        header = format_row(headers)  # May widen a column whose header is longer than the given width
+        out.write(border() + header + border())
+        for row in chain(sample, rows):
+            out.write(format_row(row))
+            count += 1
+        out.write(border())
+        out.flush()
+    except BrokenPipeError:
+        pass  # The user quit the pager early
+    finally:
+        if proc:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            proc.wait()
+    return count